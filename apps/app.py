@@ -1,9 +1,12 @@
 import callbacks
+import datasets
 import layout
+import metrics
 
 import dash_bootstrap_components as dbc
 import dash
 import flask
+import json
 
 
 app = dash.Dash(
@@ -15,6 +18,13 @@ app = dash.Dash(
     ],
 )
 server = app.server
+metrics.init_server(server)
+
+
+@server.route('/metrics/datasets')
+def dataset_memory():
+    # rows and per-column memory of the datasets held by this worker
+    return flask.Response(json.dumps(datasets.stats()), mimetype='application/json')
 
 
 app.layout = layout.LAYOUT
@@ -0,0 +1,102 @@
+from collections import Counter
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import fetch
+import normalize
+import trackcache
+
+
+logger = logging.getLogger(__name__)
+
+# columns joined from each track's artists. They're offered in the dropdowns
+# up front, but only fetched once one of them is picked (see `enrich`)
+COLUMNS = ['artist.genre', 'artist.genres', 'artist.popularity', 'artist.followers']
+NUMERIC = ['artist.popularity', 'artist.followers']
+COLORBY = ['artist.genre'] + NUMERIC
+
+
+def available(prof):
+    """The artist columns `prof`'s dataset can be enriched with but doesn't have yet."""
+    if 'artists.id' not in prof['columns']:
+        return []
+    return [c for c in COLUMNS if c not in prof['columns']]
+
+
+def picked(values):
+    """Whether any of the dropdown `values` (single or multi) is an artist column."""
+    for value in values:
+        for v in value if isinstance(value, list) else [value]:
+            if v in COLUMNS:
+                return True
+    return False
+
+
+def missing(ref):
+    df = datasets.get(ref)
+    return df is not None and 'artists.id' in df and not all(c in df for c in COLUMNS)
+
+
+def _credits(df):
+    """`(codes, credits)`: each row's code into the distinct lists of artist IDs."""
+    series = df['artists.id']
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    credits = [c.split(", ") if c else [] for c in series.cat.categories]
+    return series.cat.codes.to_numpy(), credits
+
+
+def artist_ids(df):
+    _, credits = _credits(df)
+    return {a for credit in credits for a in credit}
+
+
+def columns(df, artists):
+    """
+    The artist columns of `df`'s rows, from `{artist_id: slim_artist}`:
+    every genre of a track's artists, the one of those most common across
+    the dataset (a colorby with few values) and the highest popularity and
+    follower count among them. Each distinct artist list is worked out once.
+    """
+    codes, credits = _credits(df)
+    found = [[artists[a] for a in credit if a in artists] for credit in credits]
+    genres = [sorted({g for artist in f for g in artist['genres']}) for f in found]
+
+    rows = np.bincount(codes[codes >= 0], minlength=len(credits))
+    counts = Counter()
+    for genre_list, n in zip(genres, rows):
+        counts.update({g: n for g in genre_list})
+
+    def best(key):
+        return [max((a[key] for a in f if a[key] is not None), default=np.nan) for f in found]
+
+    def take(values, dtype=object):
+        # code -1 (no artists) picks the trailing missing value
+        return np.append(np.array(values, dtype=dtype), np.array([None], dtype=dtype))[codes]
+
+    return pd.DataFrame({
+        'artist.genre': take([max(g, key=lambda x: (counts[x], x)) if g else None for g in genres]),
+        'artist.genres': take([", ".join(g) if g else None for g in genres]),
+        'artist.popularity': take(best('popularity'), np.float32),
+        'artist.followers': take(best('followers'), np.float64),
+    }, index=df.index).astype({'artist.genre': 'category', 'artist.genres': 'category'})
+
+
+def enrich(ref, client, report=None, check=None):
+    """
+    Look up the artists of `ref`'s dataset and store it again with the
+    artist columns joined, as a new version; returns its ref. `check` is
+    called right before storing, to abort if the lookup was superseded.
+    """
+    df = datasets.get(ref)
+    artists = fetch.fetch_artists(
+        client, artist_ids(df), cache=trackcache.get_cache(normalize.FIELDS), report=report,
+    )
+    enriched = pd.concat([df.drop(columns=COLUMNS, errors='ignore'), columns(df, artists)], axis=1)
+    if check is not None:
+        check()
+    return datasets.put(enriched, key=ref['key'])
@@ -0,0 +1,87 @@
+// Presentation-only chart controls, applied to the rendered figure in the
+// browser instead of re-rendering it on the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    spotiviz: {
+        showScatterLines: function (showLines, graphId) {
+            var gd = plotOf(graphId);
+            if (!gd) {
+                return window.dash_clientside.no_update;
+            }
+            var update = {mode: [], x: [], y: [], z: [], 'marker.color': []};
+            var traces = dataTraces(gd);
+            traces.forEach(function (i) {
+                var trace = gd.data[i];
+                update.mode.push(showLines ? 'markers+lines' : 'markers');
+                if (!showLines || !trace.x) {
+                    ['x', 'y', 'z', 'marker.color'].forEach(function (key) { update[key].push(undefined); });
+                    return;
+                }
+                // lines join the points in x order
+                var order = Array.from(trace.x, function (_, i) { return i; });
+                order.sort(function (a, b) { return trace.x[a] < trace.x[b] ? -1 : trace.x[a] > trace.x[b] ? 1 : 0; });
+                var color = trace.marker && trace.marker.color;
+                update.x.push(permute(trace.x, order));
+                update.y.push(permute(trace.y, order));
+                update.z.push(trace.z ? permute(trace.z, order) : undefined);
+                update['marker.color'].push(isArray(color) ? permute(color, order) : undefined);
+            });
+            Plotly.restyle(gd, update, traces);
+            return window.dash_clientside.no_update;
+        },
+
+        showPolarLines: function (showLines, aggregate, graphId) {
+            var gd = plotOf(graphId);
+            if (!gd) {
+                return window.dash_clientside.no_update;
+            }
+            var update = {fill: showLines ? 'toself' : 'none'};
+            if (aggregate !== 'iqr') {
+                update.mode = showLines ? 'markers+lines' : 'markers';
+            }
+            Plotly.restyle(gd, update, dataTraces(gd));
+            return window.dash_clientside.no_update;
+        },
+
+        setPolarRange: function (rangeMin, rangeMax, graphId) {
+            var gd = plotOf(graphId);
+            if (!gd) {
+                return window.dash_clientside.no_update;
+            }
+            var blank = function (v) { return v === null || v === undefined || v === ''; };
+            if (blank(rangeMin) && blank(rangeMax)) {
+                Plotly.relayout(gd, {'polar.radialaxis.autorange': true});
+            } else {
+                Plotly.relayout(gd, {'polar.radialaxis.range': [
+                    blank(rangeMin) ? null : Number(rangeMin),
+                    blank(rangeMax) ? null : Number(rangeMax),
+                ]});
+            }
+            return window.dash_clientside.no_update;
+        },
+    },
+});
+
+function plotOf(graphId) {
+    var el = document.getElementById(graphId);
+    var gd = el && el.querySelector('.js-plotly-plot');
+    return gd && gd.data && gd.data.length ? gd : null;
+}
+
+// indices of the data traces, leaving out the similar-track highlights
+function dataTraces(gd) {
+    var indices = [];
+    gd.data.forEach(function (trace, i) {
+        if (trace.meta !== 'highlight') {
+            indices.push(i);
+        }
+    });
+    return indices;
+}
+
+function isArray(v) {
+    return Array.isArray(v) || ArrayBuffer.isView(v);
+}
+
+function permute(values, order) {
+    return order.map(function (i) { return values[i]; });
+}
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# `memory` keeps entries in this process; `file` and `redis` share them between processes
+BACKEND = os.environ.get('SPOTIVIZ_CACHE_BACKEND', 'memory')
+CACHE_DIR = os.environ.get(
+    'SPOTIVIZ_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'spotiviz-cache')
+)
+REDIS_URL = os.environ.get('SPOTIVIZ_REDIS_URL', 'redis://localhost:6379/0')
+
+
+class MemoryBackend:
+    """In-process LRU with optional per-entry TTL."""
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class FileBackend:
+    """Pickled entries in a shared directory, pruned oldest-first past `max_items`."""
+
+    def __init__(self, namespace, max_items=256, directory=CACHE_DIR):
+        self.max_items = max_items
+        self.directory = os.path.join(directory, namespace)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        # bump the mtime so pruning is least-recently-used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        path = self._path(key)
+        # write-then-rename so other processes never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except FileNotFoundError:
+            return 0
+
+    def _prune(self):
+        # skip other writers' in-flight temp files
+        entries = [e for e in os.listdir(self.directory) if not e.startswith('.')]
+        if len(entries) <= self.max_items:
+            return
+        paths = [os.path.join(self.directory, e) for e in entries]
+        paths.sort(key=self._mtime)
+        for path in paths[:len(paths) - self.max_items]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RedisBackend:
+    """
+    Pickled entries in any Redis-compatible server. Size is bounded by the
+    server's `maxmemory`/`maxmemory-policy`, not by `max_items`.
+    """
+
+    def __init__(self, namespace, url=REDIS_URL):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("SPOTIVIZ_CACHE_BACKEND=redis requires the `redis` package")
+        self.prefix = f"spotiviz:{namespace}:"
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._client.set(self.prefix + key, raw, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+
+def is_shared():
+    return BACKEND != 'memory'
+
+
+def get_backend(namespace, max_items=256):
+    if BACKEND == 'file':
+        logger.info(f"using file backend for `{namespace}` at {CACHE_DIR}")
+        return FileBackend(namespace, max_items=max_items)
+    if BACKEND == 'redis':
+        logger.info(f"using redis backend for `{namespace}` at {REDIS_URL}")
+        return RedisBackend(namespace)
+    if BACKEND != 'memory':
+        raise ValueError(f"unknown SPOTIVIZ_CACHE_BACKEND: {BACKEND}")
+    return MemoryBackend(max_items=max_items)
@@ -1,4 +1,4 @@
-from dash import dcc, html, Input, Output, State, ALL, MATCH
+from dash import dcc, html, ClientsideFunction, Input, Output, State, ALL, MATCH
 import dash
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
@@ -6,13 +6,28 @@ import dash_mantine_components as dmc
 from flask import request
 from urllib import parse
 
+import artists
+import catalog
+import datasets
+import embedding
+import fetch
+import figcache
+import figures
+import jobs
 import logging
+import metrics
+import normalize
+import numpy as np
 import os
-import pandas as pd
+import overlap
 import plotly.express as px
-import plotly.graph_objs as go
 import pprint
-import spotipy
+import schema
+import sessions
+import similar
+import tablequery
+import time
+import trackcache
 
 
 logging.basicConfig(
@@ -21,12 +36,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-CHAR_LIMIT = 40
-SCOPE = 'user-library-read playlist-read-private'
+# seconds between partial dataset updates while playlists are loading
+PROGRESSIVE_INTERVAL = 1.0
+# table rows carry their dataset position under this key, to find the selected track
+ROW_KEY = '_row'
+
+
+def present(df, column):
+    """`column` if `df` has it, else None: artist columns picked before their lookup finishes aren't there yet."""
+    return column if df is not None and column in df else None
+
+
+def current_highlight(highlight, ref):
+    """`highlight` if it was found on `ref`, or on an earlier batch whose rows `ref` starts with, else None."""
+    if highlight and (highlight['ref'] == ref or datasets.delta(highlight['ref'], ref) is not None):
+        return highlight
+    return None
 
 
 def register_callbacks(app):
     logger = app.logger
+    # time every callback registered below
+    app = metrics.InstrumentedApp(app)
 
 
     @app.callback(
@@ -36,9 +67,9 @@ def register_callbacks(app):
     def store_token(url):
         parsed = parse.urlparse(url)
         args = parse.parse_qs(parsed.query)
-        if args:
-            token = args['code'][0]
-            return token
+        if args and 'code' in args:
+            # exchange the auth code once; callbacks share the session's client
+            return sessions.sign_in(args['code'][0])
         return
 
 
@@ -51,14 +82,11 @@ def register_callbacks(app):
         ]
     )
     def toggle_signin(token, sign_in, data):
-        if not token:
+        client = sessions.get_client(token)
+        if client is None:
             return sign_in
-        
-        auth_manager = spotipy.oauth2.SpotifyOAuth(scope=SCOPE)
-        auth_manager.get_access_token(token)
-        client = spotipy.Spotify(auth_manager=auth_manager)
         try:
-            user = client.me()
+            user = fetch.call(client.me)
             return data
         except Exception as e:
             logger.error(e)
@@ -70,8 +98,7 @@ def register_callbacks(app):
         Input('url', 'href'),
     )
     def show_sign_in_link(x):
-        auth_manager = spotipy.oauth2.SpotifyOAuth(scope=SCOPE)
-        return auth_manager.get_authorize_url()
+        return sessions.get_authorize_url()
 
 
     @app.callback(
@@ -79,17 +106,14 @@ def register_callbacks(app):
         Input('sign-in-token', 'data'),
     )
     def show_welcome(token):
-        if not token:
+        client = sessions.get_client(token)
+        if client is None:
             return []
-        
-        auth_manager = spotipy.oauth2.SpotifyOAuth(scope=SCOPE)
-        auth_manager.get_access_token(token)
-        client = spotipy.Spotify(auth_manager=auth_manager)
 
-        user = client.me()
+        user = fetch.call(client.me)
         username = user['display_name']
         user_icon = user['images'][0]['url']
-        logger.info(f"user info: {user}")
+        logger.debug(f"user info: {user}")
 
         user_bar = dbc.Row([
             dbc.Col(
@@ -106,382 +130,718 @@ def register_callbacks(app):
 
 
     @app.callback(
-        Output('playlists', 'data'),
-        Input('sign-in-token', 'data'),
+        [
+            Output('playlists', 'data'),
+            Output('playlists-more-div', 'hidden'),
+            Output('playlists-limit', 'data'),
+            Output('catalog-poll', 'disabled'),
+            Output('catalog-job', 'data'),
+        ],
+        [
+            Input('sign-in-token', 'data'),
+            Input('playlist-search', 'value'),
+            Input('playlists-more', 'n_clicks'),
+            Input('catalog-poll', 'n_intervals'),
+        ],
+        [
+            State('playlists', 'value'),
+            State('playlists-limit', 'data'),
+            State('catalog-job', 'data'),
+        ],
     )
-    def show_playlists(token):
-        if not token:
-            return dash.no_update
-
-        auth_manager = spotipy.oauth2.SpotifyOAuth(scope=SCOPE)
-        auth_manager.get_access_token(token)
-        client = spotipy.Spotify(auth_manager=auth_manager)
-
-        playlist_resp = client.current_user_playlists(limit=50)
-        logger.info(f"playlist_resp keys: {playlist_resp.keys()}")
-        if 'items' not in playlist_resp:
-            return []
-        playlists = playlist_resp['items']
-        logger.info(f"playlists: {len(playlists)} --> {playlists[0]}")
-
-        options = []
-        for playlist in playlists:
-            playlist_label = playlist['name'][:CHAR_LIMIT]
-            if len(playlist['name']) > CHAR_LIMIT:
-                playlist_label += "..."
-            options.append({
-                'label': playlist_label, 
-                'value': playlist['id']
-            })
-        # options = sorted(options, key=lambda x: x['label'])
-        return options
+    def show_playlists(token, search, more_clicks, n_intervals, selected, limit, job_id):
+        client = sessions.get_client(token)
+        if client is None:
+            return [], True, catalog.CHIPS_PER_PAGE, True, None
+
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        user_id = catalog.user_id(token, client)
+        cat = catalog.get(user_id)
+        limit = limit or catalog.CHIPS_PER_PAGE
+        polling = dash.no_update
+
+        if 'sign-in-token.data' in triggered:
+            # show the cached catalog right away and refresh it in the background
+            limit = catalog.CHIPS_PER_PAGE
+            if cat is None or cat.stale():
+                job_id = jobs.submit(lambda job: catalog.refresh(client, user_id, token), owner=f"catalog:{token}")
+                polling = False
+        elif 'catalog-poll.n_intervals' in triggered:
+            status = jobs.status(job_id)
+            if status is None or status['state'] not in ('queued', 'running'):
+                polling = True
+                if status and status['state'] == 'failed':
+                    logger.warning(f"playlist catalog refresh failed: {status['error']}")
+        elif 'playlists-more.n_clicks' in triggered:
+            limit += catalog.CHIPS_PER_PAGE
+        elif 'playlist-search.value' in triggered:
+            limit = catalog.CHIPS_PER_PAGE
+
+        if cat is None:
+            return [], True, limit, polling, job_id
+
+        playlists, more = cat.page(search, limit=limit, pinned=selected or ())
+        options = [
+            {'label': figures.truncate(p['name']), 'value': p['id']}
+            for p in playlists
+        ]
+        return options, not more, limit, polling, job_id
 
 
     @app.callback(
-        Output('track-data', 'data'),
-        Input('playlists', 'value'),
+        [
+            Output('track-data', 'data'),
+            Output('load-job', 'data'),
+            Output('load-poll', 'disabled'),
+            Output('load-progress-div', 'hidden'),
+            Output('load-progress', 'value'),
+            Output('load-progress', 'label'),
+            Output('load-status', 'children'),
+        ],
+        [
+            Input('playlists', 'value'),
+            Input('load-poll', 'n_intervals'),
+            Input('artist-poll', 'n_intervals'),
+        ],
         [
             State('sign-in-token', 'data'),
-            State('playlists', 'data'),
+            State('track-data', 'data'),
+            State('load-job', 'data'),
+            State('artist-columns', 'data'),
+            State('artist-job', 'data'),
         ]
     )
-    def load_playlist_tracks(playlist_ids, token, playlist_options):
-        if not (token and playlist_ids):
-            return []
-
-        auth_manager = spotipy.oauth2.SpotifyOAuth(scope=SCOPE)
-        auth_manager.get_access_token(token)
-        client = spotipy.Spotify(auth_manager=auth_manager)
-
-        playlist_id_to_name = {p['value']: p['label'] for p in playlist_options}
-
-        data = []
-        for playlist_id in playlist_ids:
-
-            # pull playlist information to get tracks
-            playlist_resp = client.playlist_items(playlist_id, fields=['total'])
-            logger.info(f"playlist_resp --> {playlist_resp}")
-            if 'total' not in playlist_resp:
-                logger.warning(f"`total` not in playlist_items() response: {playlist_resp}")
-                continue
-
-            tracks = []
-            total = playlist_resp['total']
-            tracks_count = len(tracks)
-            while tracks_count < total:
-                playlist_info = client.playlist_items(playlist_id, offset=tracks_count)
-                playlist_tracks = playlist_info['items']
-                logger.info(f"playlist `{playlist_id}` tracks ({tracks_count}/{total}) --> {pprint.pformat(playlist_info, depth=2)}")
-                tracks += playlist_tracks
-                tracks_count = len(tracks)
-
-                # add extra track info (acousticness/dancceability/energy/etc)
-                track_uris = [t['track']['uri'] for t in playlist_tracks]
-                feats = client.audio_features(tracks=track_uris)
-
-                for playlist_track, feat in zip(playlist_tracks, feats):
-                    track = playlist_track['track']
-                    track['user_playlist'] = playlist_id_to_name[playlist_id]
-                    feat_rec = {"audio_feature." + k: v for k, v in feat.items()}
-                    track.update(feat_rec)
-
-                    for k, v in playlist_track.items():
-                        if isinstance(v, (dict, list)):
-                            logger.warning(f"not adding {type(v)} --> {k}: {v}")
-                            continue
-                        track[k] = v
-
-                    if track not in data:
-                        data.append(track)
-
-        df = pd.json_normalize(data)
-        df['artists'] = df['artists'].apply(
-            lambda x: ", ".join(sorted([a['name'] for a in x]))
-        )
-
-        for col in df.columns:
-            has_lists = df[col].apply(lambda x: isinstance(x, list)).any()
-            if not has_lists.any():
-                continue
-            try:
-                df[col] = df[col].apply(lambda x: "/".join(x))
-            except Exception as e:
-                logger.error(f"error expanding `{col}`: {e} --> {df[col].values[0]}")
-                df.drop(col, axis=1, inplace=True)
-
-        for col in ['added_at', 'album.release_date']:
-            if col not in df.columns:
-                df[col] = pd.NA
-            df[col] = pd.to_datetime(df[col])
-
-        return df.to_dict("records")
+    def load_playlist_tracks(playlist_ids, n_intervals, artist_ticks, token, ref, job_id, artist_columns, artist_job):
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        if 'load-poll.n_intervals' in triggered:
+            return poll_playlist_load(job_id, ref, token, artist_columns)
+        if 'artist-poll.n_intervals' in triggered:
+            # take over polling the artist lookup `request_artist_columns` started,
+            # unless a newer load has superseded it since
+            status = jobs.status(artist_job)
+            if status is None or status['state'] in ('failed', 'cancelled'):
+                return [dash.no_update] * 7
+            return dash.no_update, artist_job, False, False, 0, "", []
+
+        client = sessions.get_client(token)
+        if not (client and playlist_ids):
+            if token:
+                jobs.cancel_owner(token)
+            return None, None, True, True, 0, "", []
+
+        cat = catalog.get(catalog.user_id(token, client))
+        # numbered where names repeat, matching the `user_playlist` column
+        playlist_id_to_name = normalize.display_names(cat.names()) if cat else {}
+        # a catalog fetched at this sign-in already has each playlist's snapshot,
+        # saving a request per playlist; an older one may predate edits
+        snapshots = cat.snapshots() if cat and cat.fetched_for(token) else None
+        def load(job):
+            # normalize pages as they arrive and append them to the dataset so
+            # the charts can render the first batches while the rest load
+            seen = set()
+            pending = {}
+            state = {'ref': None, 'flushed': time.time()}
+
+            def flush():
+                if not pending:
+                    return
+                batch = normalize.normalize(pending, playlist_id_to_name, seen=seen)
+                pending.clear()
+                # a superseded load stops before writing; each load has its own
+                # dataset key, so a write that slips past this can't reach the new one
+                job.check()
+                if state['ref'] is None:
+                    state['ref'] = datasets.put(batch)
+                else:
+                    state['ref'] = datasets.append(batch, state['ref']['key'])
+                state['flushed'] = time.time()
+                job.publish(state['ref'])
+
+            def on_batch(playlist_id, pairs):
+                pending.setdefault(playlist_id, []).extend(pairs)
+                if time.time() - state['flushed'] >= PROGRESSIVE_INTERVAL:
+                    flush()
+
+            fetch.fetch_playlists(
+                client, playlist_ids,
+                cache=trackcache.get_cache(normalize.FIELDS),
+                report=lambda p, done, total: job.report(playlist_id_to_name.get(p, p), done, total),
+                on_batch=on_batch,
+                snapshots=snapshots,
+                fields=normalize.api_fields(),
+            )
+            flush()
+            if state['ref'] is None:
+                job.check()
+                return datasets.put(normalize.normalize({}, playlist_id_to_name))
+            return state['ref']
+
+        # a new selection supersedes (and cancels) this session's previous load
+        job_id = jobs.submit(load, owner=token)
+        return dash.no_update, job_id, False, False, 0, "", []
+
+
+    def enrich_artists(token, ref):
+        """
+        Start looking up `ref`'s artists in the background, if it doesn't have
+        the artist columns yet; returns the job's ID.
+        """
+        client = sessions.get_client(token)
+        if client is None or not artists.missing(ref):
+            return None
+
+        def enrich(job):
+            return artists.enrich(
+                ref, client, report=lambda done, total: job.report("artists", done, total), check=job.check,
+            )
 
+        return jobs.submit(enrich, owner=token)
+
+
+    def supersede(ref, new):
+        """Drop the dataset of the previous selection once the browser moves on to a new one."""
+        if ref and new and new['key'] != ref['key']:
+            datasets.discard(ref['key'])
+
+
+    def poll_playlist_load(job_id, ref, token, artist_columns):
+        status = jobs.status(job_id)
+        if status is None:
+            return dash.no_update, dash.no_update, True, True, 0, "", []
+
+        if status['state'] == 'done':
+            result = status['result'] if status['result'] != ref else dash.no_update
+            supersede(ref, status['result'])
+            # artist columns picked while loading: show the tracks, then look their artists up
+            enrich_job = artist_columns and enrich_artists(token, status['result'])
+            if enrich_job:
+                return result, enrich_job, False, False, 0, "", []
+            return result, dash.no_update, True, True, 100, "", []
+        if status['state'] in ('failed', 'cancelled'):
+            logger.warning(f"playlist load {status['state']}: {status['error']}")
+            return dash.no_update, dash.no_update, True, True, 0, "", []
+
+        progress = status['progress']
+        done = sum(d for d, _ in progress.values())
+        total = sum(t for _, t in progress.values())
+        lines = [
+            html.Div(f"{name}: {d}/{t}")
+            for name, (d, t) in progress.items()
+        ]
+        value = 100 * done / total if total else 0
+        # hand each new partial version to the charts/table as it lands
+        partial = status['partial']
+        if partial is None or partial == ref:
+            partial = dash.no_update
+        supersede(ref, status['partial'])
+        return partial, dash.no_update, False, False, value, f"{done}/{total}", lines
 
-    @app.callback(
-        Output('scatter-colorby', 'value'),
-        Input('track-data', 'data'),
-        State('scatter-colorby', 'value'),
-    )
-    def set_default_colorby(data, colorby):
-        if not data:
-            return dash.no_update
-        colorby = colorby or 'user_playlist'
-        return colorby
 
-    
     @app.callback(
-        Output('polar-colorby', 'value'),
-        Input('track-data', 'data'),
-        State('polar-colorby', 'value'),
+        [
+            Output('artist-columns', 'data'),
+            Output('artist-job', 'data'),
+            Output('artist-poll', 'max_intervals'),
+        ],
+        [
+            Input('scatter-xaxis', 'value'),
+            Input('scatter-yaxis', 'value'),
+            Input('scatter-zaxis', 'value'),
+            Input('scatter-colorby', 'value'),
+            Input('polar-dims', 'value'),
+            Input('polar-colorby', 'value'),
+            Input('map-colorby', 'value'),
+            Input('ternary-a', 'value'),
+            Input('ternary-b', 'value'),
+            Input('ternary-c', 'value'),
+            Input('ternary-colorby', 'value'),
+        ],
+        [
+            State('artist-columns', 'data'),
+            State('sign-in-token', 'data'),
+            State('track-data', 'data'),
+            State('load-job', 'data'),
+            State('artist-poll', 'n_intervals'),
+        ],
     )
-    def set_default_colorby(data, colorby):
-        if not data:
-            return dash.no_update
-        colorby = colorby or 'user_playlist'
-        return colorby
+    def request_artist_columns(*values):
+        # artists are only looked up while one of their columns is picked somewhere.
+        # `track-data` is only read here: `load_playlist_tracks` picks the lookup up
+        # from `artist-poll`, since taking `artist-columns` as its Input would close
+        # a loop through the dropdowns `apply_profile` sets
+        *values, requested, token, ref, job_id, ticks = values
+        wanted = artists.picked(values)
+        if wanted == bool(requested):
+            return dash.no_update, dash.no_update, dash.no_update
+        status = jobs.status(job_id)
+        # a running load is enriched once it's done (see `poll_playlist_load`)
+        if not wanted or (status and status['state'] in ('queued', 'running')):
+            return wanted, dash.no_update, dash.no_update
+        enrich_job = enrich_artists(token, ref)
+        if enrich_job is None:
+            return wanted, dash.no_update, dash.no_update
+        # one more tick hands the lookup to `load_playlist_tracks`
+        return wanted, enrich_job, (ticks or 0) + 1
 
 
     @app.callback(
-        Output('table', 'columns'),
+        [
+            Output('table', 'columns'),
+            Output('table', 'hidden_columns'),
+            Output('scatter-xaxis', 'options'),
+            Output('scatter-yaxis', 'options'),
+            Output('scatter-zaxis', 'options'),
+            Output('scatter-colorby', 'options'),
+            Output('scatter-colorby', 'value'),
+            Output('polar-dims', 'options'),
+            Output('polar-dims', 'value'),
+            Output('polar-colorby', 'options'),
+            Output('polar-colorby', 'value'),
+            Output('polar-range-min', 'value'),
+            Output('polar-range-max', 'value'),
+            Output('map-colorby', 'options'),
+            Output('map-colorby', 'value'),
+            Output('ternary-a', 'options'),
+            Output('ternary-a', 'value'),
+            Output('ternary-b', 'options'),
+            Output('ternary-b', 'value'),
+            Output('ternary-c', 'options'),
+            Output('ternary-c', 'value'),
+            Output('ternary-colorby', 'options'),
+            Output('ternary-colorby', 'value'),
+        ],
         Input('track-data', 'data'),
+        [
+            State('scatter-colorby', 'value'),
+            State('polar-dims', 'value'),
+            State('polar-colorby', 'value'),
+            State('polar-range-min', 'value'),
+            State('polar-range-max', 'value'),
+            State('map-colorby', 'value'),
+            State('ternary-a', 'value'),
+            State('ternary-b', 'value'),
+            State('ternary-c', 'value'),
+            State('ternary-colorby', 'value'),
+        ],
     )
-    def show_table_columns(data):
-        if not data:
-            return []
-
-        df = pd.DataFrame(data)
-        columns = [
-            {'id': col, 'name': col, 'hideable': True}
-            for col in df.columns
+    def apply_profile(ref, scatter_colorby, dims, polar_colorby, range_min, range_max, map_colorby,
+                      ternary_a, ternary_b, ternary_c, ternary_colorby):
+        # every column list and default comes from one profile per dataset version
+        prof = datasets.derive(ref, 'profile', schema.profile)
+        if prof is None:
+            return [[], []] + [dash.no_update] * 21
+
+        names = schema.names(prof)
+        table_columns = [{'id': col, 'name': col, 'hideable': True} for col in names]
+        # artist columns are offered before they're fetched (see `request_artist_columns`)
+        lazy = artists.available(prof)
+        options = [{'label': col, 'value': col} for col in names + lazy]
+        colorby = schema.colorby(prof)
+        colorby_options = [
+            {'label': col, 'value': col} for col in colorby + [c for c in lazy if c in artists.COLORBY]
+        ]
+        polar_options = [
+            {'label': col, 'value': col} for col in schema.numeric(prof) + [c for c in lazy if c in artists.NUMERIC]
         ]
-        columns = sorted(columns, key=lambda x: x['name'])
-        return columns
-
-
-    @app.callback(
-        Output('table', 'hidden_columns'),
-        Input('track-data', 'data'),
-    )
-    def show_table_columns(data):
-        if not data:
-            return []
 
-        df = pd.DataFrame(data)
-        columns = [
-            c for c in df.columns 
-            if c.endswith((".uri", ".id", "available_markets", "isrc"))
-            or "_url" in c or "href" in c
-            or c == 'id'
+        default_colorby = schema.DEFAULT_COLORBY if schema.DEFAULT_COLORBY in colorby else None
+        dims = dims or [d for d in schema.DEFAULT_POLAR_DIMS if d in prof['columns']]
+        if range_min is None and range_max is None:
+            range_min, range_max = schema.value_range(prof, dims)
+        ternary_defaults = [d if d in prof['columns'] else None for d in schema.DEFAULT_TERNARY_DIMS]
+        return [
+            table_columns,
+            schema.hidden(prof),
+            options,
+            options,
+            options,
+            colorby_options,
+            scatter_colorby or default_colorby,
+            polar_options,
+            dims,
+            colorby_options,
+            polar_colorby or default_colorby,
+            range_min,
+            range_max,
+            colorby_options,
+            map_colorby or default_colorby,
+            polar_options,
+            ternary_a or ternary_defaults[0],
+            polar_options,
+            ternary_b or ternary_defaults[1],
+            polar_options,
+            ternary_c or ternary_defaults[2],
+            colorby_options,
+            ternary_colorby or default_colorby,
         ]
-        return columns
 
 
     @app.callback(
-        Output('table', 'data'),
-        Input('track-data', 'data')
+        [
+            Output('table', 'data'),
+            Output('table', 'page_count'),
+        ],
+        [
+            Input('track-data', 'data'),
+            Input('table', 'page_current'),
+            Input('table', 'page_size'),
+            Input('table', 'sort_by'),
+            Input('table', 'filter_query'),
+            Input('table', 'hidden_columns'),
+        ],
     )
-    def show_table(data):
-        if not data:
-            return []
-        logger.info(f"loading {len(data)} row(s) into table: {pprint.pformat(data[:3], depth=2)}")
-        return data
+    def show_table(ref, page_current, page_size, sort_by, filter_query, hidden_columns):
+        df = datasets.get(ref)
+        if df is None:
+            return [], 1
+
+        # only ship the visible columns of the current page to the browser
+        hidden = set(hidden_columns or [])
+        columns = [c for c in df.columns if c not in hidden]
+        data, page_count = tablequery.query_page(
+            df, page_current, page_size,
+            sort_by=sort_by,
+            filter_query=filter_query,
+            columns=columns,
+            position_key=ROW_KEY,
+        )
+        logger.info(f"loading {len(data)} row(s) into table")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"first rows: {pprint.pformat(data[:3], depth=2)}")
+        return data, page_count
 
 
     @app.callback(
         [
-            Output('scatter-xaxis', 'options'),
-            Output('scatter-yaxis', 'options'),
-            Output('scatter-zaxis', 'options'),
-            Output('scatter-colorby', 'options'),
-            Output('polar-dims', 'options'),
-            Output('polar-colorby', 'options'),
+            Output('similar-tracks', 'data'),
+            Output('similar-tracks-list', 'children'),
+            Output('table', 'selected_rows'),
+        ],
+        [
+            Input('table', 'selected_rows'),
+            Input('track-data', 'data'),
+            Input('table', 'page_current'),
+            Input('table', 'sort_by'),
+            Input('table', 'filter_query'),
+        ],
+        [
+            State('table', 'data'),
+            State('similar-tracks', 'data'),
         ],
-        Input('track-data', 'data'),
     )
-    def add_columns(data):
-        if not data:
-            return dash.no_update
-
-        df = pd.DataFrame(data)
-        columns = [
-            {'label': col, 'value': col}
-            for col in df.columns
+    def find_similar_tracks(selected_rows, ref, page_current, sort_by, filter_query, data, highlight):
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        # `selected_rows` are positions in the page shown, so they only still
+        # point at the same track while the page and the dataset's rows stay put
+        paged = any(p in triggered for p in ('table.page_current', 'table.sort_by', 'table.filter_query'))
+        if paged or 'track-data.data' in triggered:
+            # appended rows keep the selection; a replaced dataset clears it
+            if not paged and current_highlight(highlight, ref):
+                return dash.no_update, dash.no_update, dash.no_update
+            if not (highlight or selected_rows):
+                return dash.no_update, dash.no_update, dash.no_update
+            return None, [], []
+
+        df = datasets.get(ref)
+        if df is None or not selected_rows or not data or selected_rows[0] >= len(data):
+            return None, [], dash.no_update
+
+        row = data[selected_rows[0]][ROW_KEY]
+        rows, distances = similar.nearest(ref, row)
+        if not rows:
+            return None, dbc.Alert("No audio features for this track.", color='secondary', className='py-1'), dash.no_update
+
+        def describe(i):
+            track = df.iloc[i]
+            return f"{track.get('name')} - {track.get('artists')} ({track.get('user_playlist')})"
+
+        items = [
+            dbc.ListGroupItem(
+                [html.Span(describe(i)), html.Small(f" {dist:.2f}", className='text-muted')],
+                className='py-1',
+            )
+            for i, dist in zip(rows, distances)
         ]
-        columns = sorted(columns, key=lambda x: x['label'])
-        return [columns] * 6
+        children = [
+            html.H6(f"Most similar to {describe(row)}", className='mt-2'),
+            dbc.ListGroup(items, flush=True),
+        ]
+        return {'ref': ref, 'row': row, 'rows': rows}, children, dash.no_update
 
 
     @app.callback(
-        Output('scatter', 'figure'),
+        [
+            Output('scatter', 'figure'),
+            Output('scatter', 'extendData'),
+            Output('scatter-state', 'data'),
+        ],
         [
             Input('scatter-xaxis', 'value'),
             Input('scatter-yaxis', 'value'),
             Input('scatter-zaxis', 'value'),
             Input('scatter-colorby', 'value'),
-            Input('scatter-showlines', 'value'),
+            Input('track-data', 'data'),
+            Input('similar-tracks', 'data'),
+        ],
+        [
+            # toggled in the browser (assets/clientside.js); only read when rebuilding
+            State('scatter-showlines', 'value'),
+            State('scatter-state', 'data'),
         ],
-        State('track-data', 'data'),
     )
-    def render_scatterplot(xaxis, yaxis, zaxis, colorby, show_lines, data):
-        fig = go.Figure()
-        fig.update_layout(
-            template='plotly_dark',
-            height=600,
-            margin=dict(t=30, l=0, r=0, b=0),
+    def render_scatterplot(xaxis, yaxis, zaxis, colorby, ref, highlight, show_lines, rendered):
+        df = datasets.get(ref)
+        xaxis, yaxis, zaxis, colorby = (present(df, c) for c in (xaxis, yaxis, zaxis, colorby))
+        if df is None or not (xaxis and yaxis):
+            return figures.base_figure(margin=dict(t=30, l=0, r=0, b=0)), dash.no_update, None
+
+        highlight = current_highlight(highlight, ref)
+        params = [xaxis, yaxis, zaxis, colorby, bool(show_lines)]
+        state = {
+            'ref': ref,
+            'params': params,
+            'groups': figures.scatter_groups(df, colorby, show_lines),
+            'gl': figures.use_gl(len(df), zaxis),
+            'highlight': highlight,
+        }
+        if rendered and rendered['params'] == params and rendered.get('highlight') == highlight:
+            if rendered['ref'] == ref:
+                return dash.no_update, dash.no_update, dash.no_update
+            # while a load is streaming in, only send the newly appended points
+            rows = datasets.delta(rendered['ref'], ref)
+            if (
+                rows is not None and state['groups'] is not None
+                and (rendered['groups'], rendered['gl']) == (state['groups'], state['gl'])
+            ):
+                extension = figures.extend_scatter(rows, state['groups'], xaxis, yaxis, zaxis, colorby)
+                if extension is not None:
+                    return dash.no_update, extension, state
+
+        fig = figcache.get_or_build(
+            ref, 'scatter', tuple(params),
+            lambda: figures.build_scatter(df, xaxis, yaxis, zaxis, colorby, show_lines),
         )
+        if highlight is not None:
+            fig = figures.with_traces(fig, figures.highlight_scatter(
+                df, highlight['row'], highlight['rows'], xaxis, yaxis, zaxis
+            ))
+        return fig, dash.no_update, state
 
-        if not (data and xaxis and yaxis):
-            return fig
 
-        df = pd.DataFrame(data)
-        
-        df['color'] = ''
-        if colorby is not None:
-            df['color'] = df[colorby]
-
-        mode = 'markers'
-        if show_lines:
-            mode = 'markers+lines'
-            df.sort_values(xaxis, inplace=True)
-
-        if zaxis is not None:
-            for group, group_df in df.groupby('color'):
-                group_label = group[:CHAR_LIMIT]
-                if len(group) > CHAR_LIMIT:
-                    group_label += "..."
-                fig.add_trace(
-                    go.Scatter3d(
-                        x=group_df[xaxis],
-                        y=group_df[yaxis],
-                        z=group_df[zaxis],
-                        name=group_label,
-                        mode=mode,
-                        marker=dict(
-                            opacity=0.6,
-                        ),
-                    )
-                )
-            fig.update_layout(
-                scene=dict(
-                    xaxis_title=xaxis,
-                    yaxis_title=yaxis,
-                    zaxis_title=zaxis,
+    @app.callback(
+        [
+            Output('map', 'figure'),
+            Output('map', 'extendData'),
+            Output('map-state', 'data'),
+        ],
+        [
+            Input('map-dims', 'value'),
+            Input('map-colorby', 'value'),
+            Input('track-data', 'data'),
+        ],
+        State('map-state', 'data'),
+    )
+    def render_map(n_dims, colorby, ref, rendered):
+        df = datasets.get(ref)
+        colorby = present(df, colorby)
+        projection = embedding.project(ref) if df is not None else None
+        if projection is None or not projection.features:
+            return figures.base_figure(margin=dict(t=30, l=0, r=0, b=0)), dash.no_update, None
+
+        points = embedding.frame(projection, df, n_dims, colorby)
+        axes = list(points.columns[:n_dims]) + [None]
+        params = [n_dims, colorby]
+        state = {
+            'ref': ref,
+            'params': params,
+            # a refit moves every point, so the map is only extended while the basis holds
+            'fit_rows': projection.fit_rows,
+            'groups': figures.scatter_groups(points, colorby, max_points=embedding.MAX_POINTS),
+            'gl': figures.use_gl(len(points), axes[2]),
+        }
+        if rendered and rendered['params'] == params and rendered['fit_rows'] == state['fit_rows']:
+            if rendered['ref'] == ref:
+                return dash.no_update, dash.no_update, dash.no_update
+            rows = datasets.delta(rendered['ref'], ref)
+            if (
+                rows is not None and state['groups'] is not None
+                and (rendered['groups'], rendered['gl']) == (state['groups'], state['gl'])
+            ):
+                extension = figures.extend_scatter(
+                    points.iloc[len(points) - len(rows):], state['groups'], *axes[:3], colorby
                 )
-            )
+                if extension is not None:
+                    return dash.no_update, extension, state
 
-        else:
-            # 2D plot
-            for group, group_df in df.groupby('color'):
-                group_label = group[:CHAR_LIMIT]
-                if len(group) > CHAR_LIMIT:
-                    group_label += "..."
-                fig.add_trace(
-                    go.Scatter(
-                        x=group_df[xaxis],
-                        y=group_df[yaxis],
-                        name=group_label,
-                        mode=mode,
-                        marker=dict(
-                            opacity=0.6,
-                        ),
-                    )
+        fig = figcache.get_or_build(
+            ref, 'map', tuple(params),
+            lambda: figures.build_scatter(points, *axes[:3], colorby, max_points=embedding.MAX_POINTS),
+        )
+        return fig, dash.no_update, state
+
+
+    @app.callback(
+        Output('ternary', 'figure'),
+        [
+            Input('ternary-a', 'value'),
+            Input('ternary-b', 'value'),
+            Input('ternary-c', 'value'),
+            Input('ternary-colorby', 'value'),
+            Input('track-data', 'data'),
+        ],
+    )
+    def render_ternary(a, b, c, colorby, ref):
+        df = datasets.get(ref)
+        dims = [present(df, d) for d in (a, b, c)]
+        colorby = present(df, colorby)
+        if df is None or not all(dims):
+            return figures.base_figure(margin=dict(t=40, l=40, r=40, b=40))
+
+        if len(df) > figures.TERNARY_MAX_POINTS:
+            # a constant-size grid of bin counts instead of every track
+            def build():
+                density = datasets.derive(
+                    ref, ('ternary', tuple(dims)), lambda df: figures.ternary_density(df, dims)
                 )
-            fig.update_layout(
-                xaxis_title=xaxis,
-                yaxis_title=yaxis,
-            )
+                return figures.build_ternary(df, dims, density=density)
+            return figcache.get_or_build(ref, 'ternary', (tuple(dims), None), build)
 
-        return fig
+        groups = None
+        if colorby is not None:
+            groups = datasets.derive(
+                ref, ('groups', colorby), lambda df: figures.group_indices(df[colorby])
+            )
+        return figcache.get_or_build(
+            ref, 'ternary', (tuple(dims), colorby),
+            lambda: figures.build_ternary(df, dims, groups),
+        )
 
 
     @app.callback(
-        Output('polar-dims', 'value'),
-        Input('track-data', 'data'),
-        State('polar-dims', 'value'),
+        Output('overlap', 'figure'),
+        [
+            Input('overlap-measure', 'value'),
+            Input('track-data', 'data'),
+        ],
     )
-    def show_default_polar_dimensions(data, dims):
-        if not data:
-            return []
-        df = pd.DataFrame(data)
-        default_dims = [
-            'audio_feature.acousticness',
-            'audio_feature.danceability',
-            'audio_feature.energy',
-            'audio_feature.instrumentalness',
-            'audio_feature.liveness',
-            'audio_feature.speechiness',
-            'audio_feature.valence',
-        ]
-        dims = dims or default_dims
-        return dims
+    def render_overlap(measure, ref):
+        result = overlap.overlap(ref)
+        if result is None or not result.playlists:
+            return figures.base_figure(margin=dict(t=40, l=40, r=40, b=40))
+        return figcache.get_or_build(
+            ref, 'overlap', measure,
+            lambda: figures.build_overlap(
+                result.playlists, result.matrix(measure), measure, overlap.MEASURES[measure]
+            ),
+        )
 
 
     @app.callback(
-        Output('polar', 'figure'),
+        [
+            Output('polar', 'figure'),
+            Output('polar', 'extendData'),
+            Output('polar-state', 'data'),
+        ],
         [
             Input('polar-dims', 'value'),
-            Input('polar-range-min', 'value'),
-            Input('polar-range-max', 'value'),
             Input('polar-colorby', 'value'),
-            Input('polar-showlines', 'value'),
+            Input('polar-aggregate', 'value'),
+            Input('track-data', 'data'),
+            Input('similar-tracks', 'data'),
+        ],
+        [
+            # applied in the browser (assets/clientside.js); only read when rebuilding
+            State('polar-range-min', 'value'),
+            State('polar-range-max', 'value'),
+            State('polar-showlines', 'value'),
+            State('polar-state', 'data'),
         ],
-        State('track-data', 'data'),
     )
-    def render_polarplot(dims, range_min, range_max, colorby, show_lines, data):
-        fig = go.Figure()
-        fig.update_layout(
-            template='plotly_dark',
-            height=600,
-            margin=dict(t=10, l=0, r=0, b=10),
-            polar=dict(
-                radialaxis=dict(
-                    visible=True,
-                    range=[range_min, range_max]
-                )
-            ),
-        )
+    def render_polarplot(dims, colorby, aggregate, ref, highlight, range_min, range_max, show_lines, rendered):
+        df = datasets.get(ref)
+        dims = [d for d in dims or [] if present(df, d)]
+        colorby = present(df, colorby)
+        if df is None or len(dims) < 2:
+            return figures.build_polar(None, dims, {}, range_min, range_max), dash.no_update, None
+
+        if range_min is None and range_max is None:
+            # the profile default apply_profile is about to fill in
+            range_min, range_max = schema.value_range(datasets.derive(ref, 'profile', schema.profile), dims)
+
+        # both are built once per dataset version and reused across interactions
+        groups = {'': np.arange(len(df))}
+        if colorby is not None:
+            groups = datasets.derive(
+                ref, ('groups', colorby), lambda df: figures.group_indices(df[colorby])
+            )
 
-        if not (data and dims):
-            return fig
-        if len(dims) < 2:
-            return fig
+        def features():
+            return datasets.derive(
+                ref, ('features', tuple(dims)), lambda df: figures.feature_matrix(df, dims)
+            )
 
-        df = pd.DataFrame(data)
-        
-        df['color'] = ''
-        if colorby is not None:
-            df['color'] = df[colorby]
-
-        mode = 'markers'
-        fill = None
-        if show_lines:
-            mode = 'markers+lines'
-            fill = 'toself'
-            
-        for group, group_df in df.groupby('color'):
-            group_label = group[:CHAR_LIMIT]
-            if len(group) > CHAR_LIMIT:
-                group_label += "..."
-
-            melted_df = group_df.melt(
-                id_vars=['id'],
-                value_vars=dims,
-            ).sort_values(['id', 'variable'])
-
-            fig.add_trace(
-                go.Scatterpolargl(
-                    r=melted_df['value'],
-                    theta=melted_df['variable'],
-                    marker=dict(
-                        opacity=0.5,
-                    ),
-                    fill=fill,
-                    mode=mode,
-                    name=group_label,
-                ),
+        def build():
+            matrix = features()
+            return figures.build_polar(
+                matrix, dims, groups, range_min, range_max,
+                show_lines=show_lines,
+                aggregate=aggregate,
             )
 
-        return fig
+        params = [list(dims), range_min, range_max, colorby, bool(show_lines), aggregate]
+        labels = list(groups)
+        highlight = current_highlight(highlight, ref)
+        state = {
+            'ref': ref,
+            'params': params,
+            # aggregates and the collapsed "other" group change as rows arrive
+            'groups': labels if aggregate == 'tracks' and figures.OTHER not in labels else None,
+            'highlight': highlight,
+        }
+        if rendered and rendered['params'] == params and rendered.get('highlight') == highlight:
+            if rendered['ref'] == ref:
+                return dash.no_update, dash.no_update, dash.no_update
+            rows = datasets.delta(rendered['ref'], ref)
+            if rows is not None and state['groups'] is not None and rendered['groups'] == state['groups']:
+                extension = figures.extend_polar(
+                    figures.feature_matrix(rows, dims), rows, state['groups'], dims, colorby
+                )
+                if extension is not None:
+                    return dash.no_update, extension, state
+
+        params = (tuple(dims), range_min, range_max, colorby, bool(show_lines), aggregate)
+        fig = figcache.get_or_build(ref, 'polar', params, build)
+        if highlight is not None:
+            fig = figures.with_traces(fig, figures.highlight_polar(
+                features(), highlight['row'], highlight['rows'], dims
+            ))
+        return fig, dash.no_update, state
+
+
+    app.clientside_callback(
+        ClientsideFunction('spotiviz', 'showScatterLines'),
+        Output('scatter-style', 'data'),
+        Input('scatter-showlines', 'value'),
+        State('scatter', 'id'),
+    )
+
+
+    app.clientside_callback(
+        ClientsideFunction('spotiviz', 'showPolarLines'),
+        Output('polar-style', 'data'),
+        Input('polar-showlines', 'value'),
+        State('polar-aggregate', 'value'),
+        State('polar', 'id'),
+    )
+
+
+    app.clientside_callback(
+        ClientsideFunction('spotiviz', 'setPolarRange'),
+        Output('polar-range', 'data'),
+        Input('polar-range-min', 'value'),
+        Input('polar-range-max', 'value'),
+        State('polar', 'id'),
+    )
 
 
     return app
\ No newline at end of file
@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import bisect
+import logging
+import os
+import re
+import time
+
+import backends
+import fetch
+
+
+logger = logging.getLogger(__name__)
+
+# largest page `current_user_playlists` allows
+PAGE_SIZE = 50
+# catalogs older than this are refreshed in the background on the next sign-in
+CATALOG_TTL = int(os.environ.get('SPOTIVIZ_CATALOG_TTL', 10 * 60))
+# chips shown per "load more"
+CHIPS_PER_PAGE = int(os.environ.get('SPOTIVIZ_PLAYLIST_CHIPS', 100))
+
+TOKEN = re.compile(r"\w+")
+
+
+def _tokens(text):
+    return TOKEN.findall(text.lower())
+
+
+class NameIndex:
+    """Prefix search over the words of playlist names."""
+
+    def __init__(self, names):
+        self._entries = sorted(
+            (token, i) for i, name in enumerate(names) for token in set(_tokens(name))
+        )
+        self._tokens = [token for token, _ in self._entries]
+
+    def _prefixed(self, prefix):
+        lo = bisect.bisect_left(self._tokens, prefix)
+        hi = bisect.bisect_left(self._tokens, prefix + '\uffff')
+        return {i for _, i in self._entries[lo:hi]}
+
+    def search(self, query):
+        """Positions of the names that have a word starting with every word of `query`."""
+        positions = None
+        for token in _tokens(query):
+            matches = self._prefixed(token)
+            positions = matches if positions is None else positions & matches
+        return sorted(positions or ())
+
+
+class Catalog:
+    """A user's playlists in library order, with their `snapshot_id` and track count."""
+
+    def __init__(self, playlists, complete=True, session=None):
+        self.playlists = playlists
+        self.complete = complete
+        # the sign-in whose refresh fetched it
+        self.session = session
+        self.fetched_at = time.time()
+        self.index = NameIndex([p['name'] for p in playlists])
+        self._by_id = {p['id']: p for p in playlists}
+
+    def __len__(self):
+        return len(self.playlists)
+
+    def stale(self, ttl=CATALOG_TTL):
+        return not self.complete or time.time() - self.fetched_at > ttl
+
+    def fetched_for(self, session):
+        """
+        Whether this catalog was fetched by `session`'s own sign-in refresh.
+        Only then are its snapshots current enough to serve playlists from
+        the track cache without checking each one.
+        """
+        # catalogs pickled before sessions were recorded have none
+        return getattr(self, 'session', None) == session and not self.stale()
+
+    def names(self):
+        return {p['id']: p['name'] for p in self.playlists}
+
+    def snapshots(self):
+        """`{playlist_id: (snapshot_id, total)}` in the form `fetch.fetch_playlists` takes."""
+        return {p['id']: (p['snapshot_id'], p['total']) for p in self.playlists}
+
+    def page(self, query=None, limit=CHIPS_PER_PAGE, pinned=()):
+        """
+        Up to `limit` playlists matching `query`, after the `pinned` (e.g.
+        selected) ones, and whether there are more to show.
+        """
+        pinned = [self._by_id[p] for p in pinned if p in self._by_id]
+        pinned_ids = {p['id'] for p in pinned}
+        if query and query.strip():
+            matches = (self.playlists[i] for i in self.index.search(query))
+        else:
+            matches = iter(self.playlists)
+
+        shown = list(pinned)
+        for playlist in matches:
+            if playlist['id'] in pinned_ids:
+                continue
+            if len(shown) >= limit + len(pinned):
+                return shown, True
+            shown.append(playlist)
+        return shown, False
+
+
+def _summary(playlist):
+    return {
+        'id': playlist['id'],
+        'name': playlist['name'],
+        'snapshot_id': playlist.get('snapshot_id'),
+        'total': playlist.get('tracks', {}).get('total', 0),
+    }
+
+
+def fetch_catalog(client, on_first_page=None, max_workers=fetch.MAX_WORKERS):
+    """
+    Fetch every page of the current user's playlists. The first page gives
+    the total, then the remaining pages are requested concurrently.
+    """
+    first = fetch.call(client.current_user_playlists, limit=PAGE_SIZE)
+    playlists = [_summary(p) for p in first.get('items', []) if p]
+    total = first.get('total', len(playlists))
+    if on_first_page is not None and total > len(playlists):
+        on_first_page(list(playlists))
+
+    offsets = range(PAGE_SIZE, total, PAGE_SIZE)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pages = pool.map(
+            lambda offset: fetch.call(client.current_user_playlists, limit=PAGE_SIZE, offset=offset),
+            offsets,
+        )
+        for page in pages:
+            playlists.extend(_summary(p) for p in page.get('items', []) if p)
+    logger.info(f"fetched {len(playlists)} playlist(s) in {len(offsets) + 1} request(s)")
+    return playlists
+
+
+class CatalogStore:
+    """Per-user playlist catalogs, shared between workers through `backend`."""
+
+    def __init__(self, backend, ttl=CATALOG_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def user_id(self, token, client):
+        """The Spotify user behind session `token`, looked up once per session."""
+        user_id = self.backend.get(f"user:{token}")
+        if user_id is None:
+            user_id = fetch.call(client.current_user)['id']
+            self.backend.set(f"user:{token}", user_id, ttl=self.ttl * 6)
+        return user_id
+
+    def get(self, user_id):
+        return self.backend.get(f"catalog:{user_id}")
+
+    def refresh(self, client, user_id, session=None):
+        """
+        Refetch `user_id`'s catalog for sign-in `session`, publishing the
+        first page as soon as it arrives.
+        """
+        previous = self.get(user_id)
+
+        def publish_first_page(playlists):
+            if previous is None:
+                self.backend.set(f"catalog:{user_id}", Catalog(playlists, complete=False))
+
+        catalog = Catalog(fetch_catalog(client, on_first_page=publish_first_page), session=session)
+        if previous is not None:
+            old = previous.snapshots()
+            changed = sum(old.get(p['id'], (None,))[0] != p['snapshot_id'] for p in catalog.playlists)
+            logger.info(f"catalog for {user_id}: {changed} of {len(catalog)} playlist(s) changed")
+        self.backend.set(f"catalog:{user_id}", catalog)
+        return len(catalog)
+
+
+STORE = CatalogStore(backends.get_backend('catalog', max_items=10000))
+
+
+def user_id(token, client):
+    return STORE.user_id(token, client)
+
+
+def get(user_id):
+    return STORE.get(user_id)
+
+
+def refresh(client, user_id, session=None):
+    return STORE.refresh(client, user_id, session=session)
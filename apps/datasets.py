@@ -0,0 +1,351 @@
+from collections import OrderedDict
+
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import backends
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.environ.get('SPOTIVIZ_DATASET_CACHE_MB', 512)) * 2 ** 20
+
+
+class Dataset:
+
+    def __init__(self, version, df, lengths=None):
+        self.version = version
+        self.df = df
+        self.column_bytes = df.memory_usage(deep=True, index=False)
+        self.nbytes = int(self.column_bytes.sum())
+        # row count at each version since the last full replace, for append deltas
+        self.lengths = lengths or {version: len(df)}
+        self.derived = {}
+        self.derived_bytes = {}
+
+    def add_derived(self, name, value, nbytes):
+        self.drop_derived(name)
+        self.derived[name] = value
+        self.derived_bytes[name] = nbytes
+        self.nbytes += nbytes
+
+    def drop_derived(self, name):
+        """Forget a derived result; returns the bytes it took."""
+        self.derived.pop(name, None)
+        nbytes = self.derived_bytes.pop(name, 0)
+        self.nbytes -= nbytes
+        return nbytes
+
+
+def sizeof(obj):
+    """Rough memory taken by the arrays, frames and containers in a derived result."""
+    total = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            total += obj.nbytes
+        elif isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+            total += int(np.sum(obj.memory_usage(deep=True)))
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        elif isinstance(obj, str):
+            total += len(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.extend(vars(obj).values())
+        else:
+            total += 8
+    return total
+
+
+class DatasetStore:
+    """
+    Memory-bounded LRU of track DataFrames. The browser only holds a
+    `{'key': ..., 'version': ...}` reference; callbacks resolve it here.
+
+    With a `shared` backend, datasets are also written there so other
+    worker processes can pick them up instead of refetching.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        self._datasets = OrderedDict()
+        # names passed to `derive_incremental`, carried over to appended versions
+        self._incremental = set()
+
+    def _keep(self, key, dataset):
+        with self._lock:
+            if key in self._datasets:
+                self.nbytes -= self._datasets.pop(key).nbytes
+            self._datasets[key] = dataset
+            self.nbytes += dataset.nbytes
+            self._evict()
+            self._record()
+
+    def _insert(self, key, dataset):
+        self._keep(key, dataset)
+        if self.shared is not None:
+            self.shared.set(key, (dataset.version, dataset.df, dataset.lengths))
+            # lets other processes check for a newer version without unpickling the rows
+            self.shared.set(f"version:{key}", dataset.version)
+        return dataset
+
+    def discard(self, key):
+        """Drop `key`'s dataset, here and from the shared backend."""
+        with self._lock:
+            dataset = self._datasets.pop(key, None)
+            if dataset is not None:
+                self.nbytes -= dataset.nbytes
+                self._record()
+        if self.shared is not None:
+            self.shared.delete(key)
+            self.shared.delete(f"version:{key}")
+        logger.info(f"discarded dataset {key[:8]}")
+
+    def _entry(self, ref):
+        if not ref:
+            return None
+        key = ref['key']
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is not None and entry.version >= ref['version']:
+                self._datasets.move_to_end(key)
+                metrics.cache_result('datasets', True)
+                return entry
+        metrics.cache_result('datasets', False)
+
+        if self.shared is not None:
+            shared = self.shared.get(key)
+            metrics.cache_result('datasets_shared', shared is not None and shared[0] >= ref['version'])
+            if shared is not None and shared[0] >= ref['version']:
+                logger.info(f"loaded dataset {key[:8]} v{shared[0]} from shared backend")
+                entry = Dataset(*shared)
+                self._keep(key, entry)
+                return entry
+
+        if entry is None:
+            logger.warning(f"dataset {key[:8]} is no longer cached")
+        return entry
+
+    def _latest(self, key):
+        with self._lock:
+            entry = self._datasets.get(key)
+        if self.shared is None:
+            return entry
+        # only fetch the shared rows if another process has stored a newer version
+        version = self.shared.get(f"version:{key}")
+        if entry is None or (version is not None and version > entry.version):
+            shared = self.shared.get(key)
+            if shared is not None and (entry is None or shared[0] > entry.version):
+                entry = Dataset(*shared)
+        return entry
+
+    def put(self, df, key=None):
+        key = key or uuid.uuid4().hex
+        latest = self._latest(key)
+        version = (latest.version if latest else 0) + 1
+
+        dataset = self._insert(key, Dataset(version, df))
+        logger.info(f"stored dataset {key[:8]} v{version}: {len(df)} row(s), {dataset.nbytes / 2 ** 20:.1f} MB")
+        return {'key': key, 'version': version}
+
+    def append(self, df, key):
+        """Append rows to `key` as a new version whose delta can be rendered incrementally."""
+        latest = self._latest(key)
+        if latest is None:
+            return self.put(df, key=key)
+
+        version = latest.version + 1
+        combined = concat(latest.df, df)
+        lengths = {**latest.lengths, version: len(combined)}
+        dataset = Dataset(version, combined, lengths)
+        for name in self._incremental:
+            done = [v for v, n in list(latest.derived) if n == name]
+            previous = (max(done), name) if done else None
+            value = latest.derived.get(previous)
+            if value is not None:
+                dataset.add_derived(previous, value, latest.derived_bytes.get(previous, 0))
+        self._insert(key, dataset)
+        logger.info(f"appended {len(df)} row(s) to dataset {key[:8]} v{version}")
+        return {'key': key, 'version': version}
+
+    def delta(self, old_ref, ref):
+        """Rows appended between `old_ref` and `ref`, or None if `ref` isn't an append of it."""
+        if not (old_ref and ref) or old_ref['key'] != ref['key']:
+            return None
+        entry = self._entry(ref)
+        if entry is None or old_ref['version'] not in entry.lengths:
+            return None
+        return self._rows(entry, ref).iloc[entry.lengths[old_ref['version']]:]
+
+    @staticmethod
+    def _rows(entry, ref):
+        # an older version of the same append lineage is a prefix of the latest rows
+        if ref['version'] < entry.version and ref['version'] in entry.lengths:
+            return entry.df.iloc[:entry.lengths[ref['version']]]
+        return entry.df
+
+    def get(self, ref):
+        entry = self._entry(ref)
+        return self._rows(entry, ref) if entry else None
+
+    def derive(self, ref, name, fn):
+        """
+        Compute `fn(df)` once per dataset version and reuse it afterwards,
+        e.g. feature matrices or group indices shared across renders.
+        """
+        entry = self._entry(ref)
+        if entry is None:
+            return None
+        name = (ref['version'], name)
+        value = entry.derived.get(name)
+        if value is None:
+            value = fn(self._rows(entry, ref))
+            self._add_derived(ref['key'], entry, name, value)
+        return value
+
+    def derive_incremental(self, ref, name, fn, extend):
+        """
+        Like `derive`, for results that can be brought up to date with
+        appended rows: `extend(previous, df, start)` updates the result for an
+        earlier version of the same lineage, `start` being its row count.
+        """
+        entry = self._entry(ref)
+        if entry is None:
+            return None
+        self._incremental.add(name)
+        key = (ref['version'], name)
+        value = entry.derived.get(key)
+        if value is None:
+            df = self._rows(entry, ref)
+            earlier = [v for v, n in list(entry.derived) if n == name and v < ref['version'] and v in entry.lengths]
+            previous = entry.derived.get((max(earlier), name)) if earlier else None
+            if previous is not None:
+                value = extend(previous, df, entry.lengths[max(earlier)])
+            else:
+                value = fn(df)
+            self._add_derived(ref['key'], entry, key, value)
+        return value
+
+    def _add_derived(self, key, entry, name, value):
+        # derived results count towards `max_bytes` like the rows they're computed from
+        nbytes = sizeof(value)
+        with self._lock:
+            held = self._datasets.get(key) is entry
+            if held:
+                self.nbytes -= entry.nbytes
+            entry.add_derived(name, value, nbytes)
+            if held:
+                self.nbytes += entry.nbytes
+                self._evict()
+                self._record()
+
+    def _evict(self):
+        # always keep the most recent dataset, even if it's over budget on its own
+        while self.nbytes > self.max_bytes and len(self._datasets) > 1:
+            key, dataset = self._datasets.popitem(last=False)
+            self.nbytes -= dataset.nbytes
+            logger.info(f"evicted dataset {key[:8]} ({dataset.nbytes / 2 ** 20:.1f} MB)")
+        # then its derived results, oldest first; they're recomputed when needed again
+        for key, dataset in self._datasets.items():
+            for name in list(dataset.derived):
+                if self.nbytes <= self.max_bytes:
+                    return
+                self.nbytes -= dataset.drop_derived(name)
+                logger.info(f"dropped derived {name[1]} of dataset {key[:8]} v{name[0]}")
+
+    def _record(self):
+        metrics.DATASETS.set(len(self._datasets))
+        metrics.DATASET_BYTES.set(self.nbytes)
+
+    def stats(self):
+        """
+        Rows and memory of each dataset held in this process, largest columns
+        first. Datasets are named by their key's prefix, as in the logs: the
+        full key is all it takes to read one.
+        """
+        with self._lock:
+            datasets = list(self._datasets.items())
+        return {
+            'nbytes': sum(d.nbytes for _, d in datasets),
+            'datasets': {
+                key[:8]: {
+                    'version': d.version,
+                    'rows': len(d.df),
+                    'nbytes': d.nbytes,
+                    'derived': sum(d.derived_bytes.values()),
+                    'columns': {c: int(n) for c, n in d.column_bytes.sort_values(ascending=False).items()},
+                }
+                for key, d in datasets
+            },
+        }
+
+
+def concat(old, new):
+    """
+    Append `new` rows to `old`, keeping categorical columns categorical
+    (plain `pd.concat` falls back to object when their categories differ).
+    """
+    combined = pd.concat([old, new], ignore_index=True)
+    for col in old.columns:
+        if (col in new and isinstance(old[col].dtype, pd.CategoricalDtype)
+                and isinstance(new[col].dtype, pd.CategoricalDtype)
+                and combined[col].dtype == object):
+            combined[col] = pd.api.types.union_categoricals(
+                [old[col], new[col]], sort_categories=True, ignore_order=True,
+            )
+    return combined
+
+
+STORE = DatasetStore(
+    # each dataset takes two entries: its rows and its version
+    shared=backends.get_backend('datasets', max_items=128) if backends.is_shared() else None,
+)
+
+
+def put(df, key=None):
+    return STORE.put(df, key=key)
+
+
+def append(df, key):
+    return STORE.append(df, key)
+
+
+def discard(key):
+    return STORE.discard(key)
+
+
+def delta(old_ref, ref):
+    return STORE.delta(old_ref, ref)
+
+
+def get(ref):
+    return STORE.get(ref)
+
+
+def derive(ref, name, fn):
+    return STORE.derive(ref, name, fn)
+
+
+def derive_incremental(ref, name, fn, extend):
+    return STORE.derive_incremental(ref, name, fn, extend)
+
+
+def stats():
+    return STORE.stats()
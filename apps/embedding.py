@@ -0,0 +1,89 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import similar
+
+
+logger = logging.getLogger(__name__)
+
+# the projection basis is kept while rows are appended, and refit once the
+# dataset has grown this many times over since it was fit
+REFIT_GROWTH = 2
+# the map renders with WebGL, so it can show far more points than the 2D scatter
+MAX_POINTS = int(os.environ.get('SPOTIVIZ_MAP_MAX_POINTS', 100000))
+COMPONENTS = 3
+
+
+class Projection:
+    """
+    PCA of the standardized audio features: the top principal axes of
+    their covariance, and every row's coordinates along them (NaN for
+    tracks without audio features).
+    """
+
+    def __init__(self, df, features=similar.FEATURES, n_components=COMPONENTS):
+        self.features = [f for f in features if f in df]
+        matrix = self._matrix(df)
+        valid = matrix[~np.isnan(matrix).any(axis=1)]
+        self.fit_rows = len(df)
+        if len(valid) < 2:
+            self.mean = np.zeros(len(self.features))
+            self.std = np.ones(len(self.features))
+            self.components = np.eye(len(self.features))[:n_components]
+            self.explained = np.zeros(len(self.components))
+        else:
+            self.mean = valid.mean(axis=0)
+            self.std = valid.std(axis=0)
+            self.std[~(self.std > 0)] = 1
+            z = (valid - self.mean) / self.std
+            eigenvalues, eigenvectors = np.linalg.eigh(z.T @ z / len(z))
+            order = np.argsort(eigenvalues)[::-1][:n_components]
+            components = eigenvectors[:, order].T
+            # fix each axis' sign, so refits don't mirror the map
+            signs = np.sign(components[np.arange(len(components)), np.abs(components).argmax(axis=1)])
+            self.components = components * signs[:, None]
+            self.explained = eigenvalues[order] / max(eigenvalues.sum(), 1e-12)
+        self.coords = self.transform(df)
+
+    def _matrix(self, df):
+        return df[self.features].to_numpy(dtype=np.float64)
+
+    def transform(self, df):
+        z = (self._matrix(df) - self.mean) / self.std
+        return (z @ self.components.T).astype(np.float32)
+
+    def extend(self, df, start):
+        """This projection brought up to date with rows `start:` of `df`."""
+        if len(df) > REFIT_GROWTH * self.fit_rows:
+            return Projection(df, self.features, len(self.components))
+        updated = object.__new__(Projection)
+        updated.__dict__.update(self.__dict__)
+        updated.coords = np.concatenate([self.coords, self.transform(df.iloc[start:])])
+        return updated
+
+    def labels(self):
+        return [
+            f"PC{i + 1} ({share:.0%} of variance)"
+            for i, share in enumerate(self.explained)
+        ]
+
+
+def project(ref):
+    """The dataset's `Projection`, updated incrementally as rows are appended."""
+    return datasets.derive_incremental(
+        ref, 'projection', Projection, lambda previous, df, start: previous.extend(df, start)
+    )
+
+
+def frame(projection, df, n_dims=2, colorby=None):
+    """The projected coordinates of `df`'s rows as columns, plus the `colorby` column."""
+    labels = projection.labels()[:n_dims]
+    coords = projection.coords[:len(df)]
+    data = {label: coords[:, i] for i, label in enumerate(labels)}
+    if colorby is not None:
+        data[colorby] = df[colorby].values
+    return pd.DataFrame(data, index=df.index)
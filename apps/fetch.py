@@ -0,0 +1,288 @@
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import logging
+import os
+import time
+
+import spotipy
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+# most IDs `audio_features` accepts per request
+FEATURES_BATCH = 100
+# most IDs `artists` accepts per request
+ARTISTS_BATCH = 50
+MAX_WORKERS = int(os.environ.get('SPOTIVIZ_FETCH_WORKERS', 8))
+MAX_RETRIES = 5
+
+
+def call(fn, *args, **kwargs):
+    """Call a spotipy method, backing off on 429s per the `Retry-After` header."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except spotipy.SpotifyException as e:
+            if e.http_status != 429 or attempt == MAX_RETRIES:
+                raise
+            retry_after = (e.headers or {}).get('Retry-After')
+            delay = float(retry_after) if retry_after else 2 ** attempt
+            logger.warning(f"rate limited on {fn.__name__}(), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def track_id(playlist_track):
+    """The Spotify ID of a playlist entry's track, or None for local files."""
+    track = playlist_track.get('track') or {}
+    if track.get('is_local'):
+        return None
+    return track.get('id')
+
+
+class FeatureBatcher:
+    """
+    Collects the unique track IDs of pages from every playlist being loaded
+    and requests their audio features in full batches, so a track shared by
+    several playlists (or pages) is only looked up once. Pages are ready to
+    pair once all of their IDs have resolved.
+    """
+
+    def __init__(self, lookup=None, batch_size=FEATURES_BATCH):
+        self.lookup = lookup
+        self.batch_size = batch_size
+        self.features = {}
+        self._queued = []
+        self._requested = set()
+        self._pages = {}
+        self._missing = {}
+        self._waiters = defaultdict(list)
+
+    def add_page(self, key, playlist_tracks):
+        """Register a page; returns True if its features are already known."""
+        self._pages[key] = playlist_tracks
+        ids = {track_id(t) for t in playlist_tracks} - {None}
+        new = ids - self._requested - self.features.keys()
+        if new and self.lookup is not None:
+            self.features.update(self.lookup(new))
+            cached = len(new)
+            new -= self.features.keys()
+            metrics.cache_result('audio_features', True, cached - len(new))
+            metrics.cache_result('audio_features', False, len(new))
+        self._queued.extend(new)
+        self._requested |= new
+
+        missing = ids - self.features.keys()
+        if not missing:
+            return True
+        self._missing[key] = missing
+        for i in missing:
+            self._waiters[i].append(key)
+        return False
+
+    def batches(self, flush=False):
+        """Take full batches of queued IDs, plus the remainder if `flush`."""
+        while len(self._queued) >= self.batch_size or (flush and self._queued):
+            batch = self._queued[:self.batch_size]
+            del self._queued[:self.batch_size]
+            yield batch
+
+    def resolve(self, ids, feats):
+        """Record a batch's results; returns the keys of pages that are now complete."""
+        ready = []
+        for i, feat in zip(ids, feats or [None] * len(ids)):
+            self.features[i] = feat
+            for key in self._waiters.pop(i, ()):
+                self._missing[key].discard(i)
+                if not self._missing[key]:
+                    del self._missing[key]
+                    ready.append(key)
+        return ready
+
+    def pairs(self, key):
+        return [
+            (playlist_track, self.features.get(track_id(playlist_track)))
+            for playlist_track in self._pages.pop(key)
+        ]
+
+
+def fetch_playlist_snapshot(client, playlist_id):
+    playlist_resp = call(client.playlist, playlist_id, fields='snapshot_id,tracks.total')
+    if 'total' not in playlist_resp.get('tracks', {}):
+        logger.warning(f"`tracks.total` not in playlist() response: {playlist_resp}")
+        return None, 0
+    return playlist_resp.get('snapshot_id'), playlist_resp['tracks']['total']
+
+
+def fetch_playlists(client, playlist_ids, cache=None, report=None, on_batch=None,
+                    snapshots=None, fields=None, max_workers=MAX_WORKERS):
+    """
+    Fetch every track page of every playlist concurrently, pipelining the
+    audio features lookup for each page as soon as that page arrives.
+
+    With a `cache`, playlists whose `snapshot_id` hasn't changed are served
+    without fetching any pages. Audio features are requested in full
+    batches of unique track IDs across all playlists, skipping local tracks
+    and tracks the cache has already seen. `snapshots` maps playlist IDs to an
+    already known `(snapshot_id, total)` (e.g. from the playlist catalog)
+    so they don't need a separate lookup. `fields` is passed through to
+    `playlist_items` to trim the item pages.
+
+    `report(playlist_id, fetched, total)` is called as pages arrive; any
+    exception it raises (e.g. a cancelled job) stops the remaining requests.
+    `on_batch(playlist_id, pairs)` is called with each page's
+    `(playlist_track, audio_feature)` pairs as soon as they're complete,
+    in arrival order.
+
+    Returns `{playlist_id: [(playlist_track, audio_feature), ...]}` with the
+    tracks in playlist order.
+    """
+    report = report or (lambda playlist_id, fetched, total: None)
+    on_batch = on_batch or (lambda playlist_id, pairs: None)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        known = snapshots or {}
+        unknown = [p for p in playlist_ids if p not in known]
+        snapshots = dict(zip(
+            unknown,
+            pool.map(lambda p: fetch_playlist_snapshot(client, p), unknown),
+        ))
+        snapshots = {p: known.get(p) or snapshots[p] for p in playlist_ids}
+
+        results = {}
+        page_queue = deque()
+        for playlist_id, (snapshot_id, total) in snapshots.items():
+            unchanged = cache is not None and snapshot_id and cache.get_snapshot_id(playlist_id) == snapshot_id
+            if cache is not None:
+                metrics.cache_result('playlists', unchanged)
+            if unchanged:
+                results[playlist_id] = cache.get_playlist(playlist_id)
+                logger.info(f"playlist `{playlist_id}` unchanged, {len(results[playlist_id])} tracks from cache")
+                report(playlist_id, total, total)
+                on_batch(playlist_id, results[playlist_id])
+                continue
+            report(playlist_id, 0, total)
+            page_queue.extend((playlist_id, offset) for offset in range(0, total, PAGE_SIZE))
+
+        page_futures = {}
+        pending = set()
+
+        def submit_page():
+            playlist_id, offset = page_queue.popleft()
+            future = pool.submit(
+                call, client.playlist_items, playlist_id,
+                fields=fields, offset=offset, limit=PAGE_SIZE,
+            )
+            page_futures[future] = (playlist_id, offset)
+            pending.add(future)
+
+        # keep only a worker's worth of pages in flight so audio feature
+        # requests aren't queued behind every remaining page
+        for _ in range(min(max_workers, len(page_queue))):
+            submit_page()
+
+        # add extra track info (acousticness/danceability/energy/etc)
+        batcher = FeatureBatcher(lookup=cache.get_audio_features if cache is not None else None)
+        pages = {}
+        feature_futures = {}
+        fetched = {p: 0 for p in playlist_ids}
+
+        def page_ready(key):
+            pages[key] = batcher.pairs(key)
+            on_batch(key[0], pages[key])
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending -= done
+                for future in done:
+                    if future in feature_futures:
+                        for key in batcher.resolve(feature_futures[future], future.result()):
+                            page_ready(key)
+                        continue
+
+                    playlist_id, offset = page_futures[future]
+                    items = future.result()['items']
+                    if page_queue:
+                        submit_page()
+                    playlist_tracks = [t for t in items if t.get('track')]
+                    total = snapshots[playlist_id][1]
+                    logger.debug(f"playlist `{playlist_id}` tracks ({offset}/{total})")
+
+                    if batcher.add_page((playlist_id, offset), playlist_tracks):
+                        page_ready((playlist_id, offset))
+                    fetched[playlist_id] += len(items)
+                    report(playlist_id, fetched[playlist_id], total)
+
+                # hold back partial batches while more pages are on their way
+                pages_in_flight = any(f in page_futures for f in pending)
+                for ids in batcher.batches(flush=not pages_in_flight):
+                    feats = pool.submit(call, client.audio_features, tracks=ids)
+                    feature_futures[feats] = ids
+                    pending.add(feats)
+        except BaseException:
+            # don't leave the pool working through pages nobody will read
+            for future in list(page_futures) + list(feature_futures):
+                future.cancel()
+            raise
+
+        for playlist_id in playlist_ids:
+            if playlist_id in results:
+                continue
+            offsets = sorted(o for p, o in pages if p == playlist_id)
+            results[playlist_id] = [pair for o in offsets for pair in pages[(playlist_id, o)]]
+
+            snapshot_id = snapshots[playlist_id][0]
+            if cache is not None and snapshot_id:
+                cache.put_playlist(playlist_id, snapshot_id, results[playlist_id])
+    return results
+
+
+def slim_artist(artist):
+    """The parts of an `artists` response the app joins onto tracks."""
+    return {
+        'genres': artist.get('genres') or [],
+        'popularity': artist.get('popularity'),
+        'followers': (artist.get('followers') or {}).get('total'),
+    }
+
+
+def fetch_artists(client, artist_ids, cache=None, report=None, max_workers=MAX_WORKERS):
+    """
+    Look up `artist_ids`, returning `{artist_id: slim_artist(...)}`. Artists
+    `cache` has seen recently are reused; the rest are requested in full
+    batches concurrently and written back to `cache`.
+
+    `report(fetched, total)` is called as batches arrive; any exception it
+    raises stops the remaining requests.
+    """
+    report = report or (lambda fetched, total: None)
+    artist_ids = list(dict.fromkeys(artist_ids))
+    artists = cache.get_artists(artist_ids) if cache is not None else {}
+    missing = [i for i in artist_ids if i not in artists]
+    if cache is not None:
+        metrics.cache_result('artists', True, len(artists))
+        metrics.cache_result('artists', False, len(missing))
+    logger.info(f"looking up {len(missing)} of {len(artist_ids)} artist(s)")
+
+    batches = [missing[i:i + ARTISTS_BATCH] for i in range(0, len(missing), ARTISTS_BATCH)]
+    report(0, len(missing))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(call, client.artists, batch) for batch in batches]
+        fetched = 0
+        try:
+            for future in as_completed(futures):
+                found = {a['id']: slim_artist(a) for a in future.result()['artists'] if a}
+                artists.update(found)
+                if cache is not None:
+                    cache.put_artists(found)
+                fetched += ARTISTS_BATCH
+                report(min(fetched, len(missing)), len(missing))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return artists
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+import backends
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+MAX_FIGURES = int(os.environ.get('SPOTIVIZ_FIGURE_CACHE_SIZE', 128))
+# figures bigger than this (e.g. a polar plot with a trace per track) are
+# rebuilt each time rather than kept, which bounds the cache to
+# MAX_FIGURES * MAX_FIGURE_BYTES
+MAX_FIGURE_BYTES = int(os.environ.get('SPOTIVIZ_FIGURE_CACHE_MAX_KB', 1024)) * 2 ** 10
+
+
+def exceeds(fig, limit):
+    """Whether the arrays, strings and numbers in `fig` take more than `limit` bytes."""
+    total = 0
+    stack = [fig]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, np.ndarray):
+            total += obj.nbytes
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, str):
+            total += len(obj)
+        else:
+            total += 8
+        if total > limit:
+            return True
+    return False
+
+
+class FigureCache:
+    """
+    Memoizes rendered figures by dataset version, chart type and chart
+    parameters, so flipping between recent views doesn't rebuild them.
+    """
+
+    def __init__(self, backend, max_bytes=MAX_FIGURE_BYTES):
+        self.backend = backend
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(ref, chart, params):
+        raw = repr((ref['key'], ref['version'], chart, params))
+        return f"{chart}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def get_or_build(self, ref, chart, params, build):
+        key = self.make_key(ref, chart, params)
+        fig = self.backend.get(key)
+        metrics.cache_result('figures', fig is not None)
+        if fig is not None:
+            logger.debug(f"figure cache hit: {key}")
+            return fig
+
+        fig = build().to_dict()
+        if exceeds(fig, self.max_bytes):
+            logger.debug(f"not caching figure {key}: over {self.max_bytes / 2 ** 20:.1f} MB")
+        else:
+            self.backend.set(key, fig)
+        return fig
+
+
+CACHE = FigureCache(backends.get_backend('figures', max_items=MAX_FIGURES))
+
+
+def get_or_build(ref, chart, params, build):
+    return CACHE.get_or_build(ref, chart, params, build)
@@ -0,0 +1,463 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+
+logger = logging.getLogger(__name__)
+
+CHAR_LIMIT = 40
+
+# above this many points 2D scatters switch from SVG to WebGL traces
+GL_THRESHOLD = int(os.environ.get('SPOTIVIZ_GL_THRESHOLD', 1000))
+# above this many points, plot a uniform random sample (which keeps the point density)
+MAX_POINTS = int(os.environ.get('SPOTIVIZ_SCATTER_MAX_POINTS', 20000))
+# above this many tracks the ternary plot shows binned density instead of points
+TERNARY_MAX_POINTS = int(os.environ.get('SPOTIVIZ_TERNARY_MAX_POINTS', 5000))
+# triangular bins per side of the ternary density grid
+TERNARY_BINS = int(os.environ.get('SPOTIVIZ_TERNARY_BINS', 30))
+# colorby values beyond the most common MAX_GROUPS - 1 are collapsed into "other"
+MAX_GROUPS = int(os.environ.get('SPOTIVIZ_MAX_GROUPS', 20))
+OTHER = "other"
+MISSING = "(none)"
+
+
+def truncate(label):
+    label = str(label)
+    if len(label) > CHAR_LIMIT:
+        return label[:CHAR_LIMIT] + "..."
+    return label
+
+
+def base_figure(**layout):
+    fig = go.Figure()
+    fig.update_layout(template='plotly_dark', height=600, **layout)
+    return fig
+
+
+def is_continuous(series):
+    return (
+        pd.api.types.is_numeric_dtype(series)
+        and not pd.api.types.is_bool_dtype(series)
+        and series.nunique() > MAX_GROUPS
+    )
+
+
+def group_labels(series, max_groups=MAX_GROUPS):
+    """Map `series` to string group labels, collapsing the long tail into "other"."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # count and relabel the categories rather than every row
+        names = np.array([str(c) for c in series.cat.categories] + [MISSING], dtype=object)
+        codes = series.cat.codes.to_numpy()
+        codes = np.where(codes < 0, len(names) - 1, codes)
+        counts = np.bincount(codes, minlength=len(names))
+        if np.count_nonzero(counts) > max_groups:
+            order = np.argsort(-counts, kind='stable')
+            names[order[max_groups - 1:]] = OTHER
+        return pd.Series(names[codes], index=series.index)
+    labels = series.astype(str).where(series.notna(), MISSING)
+    counts = labels.value_counts()
+    if len(counts) > max_groups:
+        keep = counts.index[:max_groups - 1]
+        labels = labels.where(labels.isin(keep), OTHER)
+    return labels
+
+
+def group_indices(series):
+    """Return `{label: row positions}` for `series`, with "other" last."""
+    labels = group_labels(series).values
+    groups = pd.Series(np.arange(len(labels))).groupby(labels, observed=True).indices
+    return dict(sorted(groups.items(), key=lambda g: (g[0] == OTHER, g[0])))
+
+
+def new_row_labels(rows, colorby, groups):
+    """
+    Positions of `rows` per existing trace label, or None if a row belongs
+    to a group that has no trace yet.
+    """
+    if colorby is None:
+        return {'': np.arange(len(rows))}
+    labels = rows[colorby].astype(str).where(rows[colorby].notna(), MISSING).values
+    if not set(labels) <= set(groups):
+        return None
+    return {group: np.flatnonzero(labels == group) for group in groups}
+
+
+def use_gl(n_points, zaxis=None):
+    return zaxis is None and n_points > GL_THRESHOLD
+
+
+def downsample(df, max_points=MAX_POINTS, seed=0):
+    if len(df) <= max_points:
+        return df
+    logger.info(f"downsampling {len(df)} point(s) to {max_points}")
+    return df.sample(max_points, random_state=seed)
+
+
+def build_scatter(df, xaxis, yaxis, zaxis=None, colorby=None, show_lines=False, max_points=MAX_POINTS):
+    fig = base_figure(margin=dict(t=30, l=0, r=0, b=0))
+    total = len(df)
+    df = downsample(df, max_points)
+
+    mode = 'markers'
+    if show_lines:
+        mode = 'markers+lines'
+        df = df.sort_values(xaxis)
+
+    if zaxis is not None:
+        trace_type = go.Scatter3d
+        fig.update_layout(
+            scene=dict(
+                xaxis_title=xaxis,
+                yaxis_title=yaxis,
+                zaxis_title=zaxis,
+            )
+        )
+    else:
+        trace_type = go.Scattergl if use_gl(len(df)) else go.Scatter
+        fig.update_layout(
+            xaxis_title=xaxis,
+            yaxis_title=yaxis,
+        )
+
+    if len(df) < total:
+        fig.update_layout(title=dict(
+            text=f"showing a random {len(df):,} of {total:,} points",
+            font=dict(size=12),
+        ))
+
+    def coords(idx=slice(None)):
+        xyz = dict(x=df[xaxis].values[idx], y=df[yaxis].values[idx])
+        if zaxis is not None:
+            xyz['z'] = df[zaxis].values[idx]
+        return xyz
+
+    if colorby is not None and is_continuous(df[colorby]):
+        # one trace with a continuous color scale instead of a trace per value
+        fig.add_trace(
+            trace_type(
+                **coords(),
+                name=colorby,
+                mode=mode,
+                marker=dict(
+                    opacity=0.6,
+                    color=df[colorby].values,
+                    colorscale='Viridis',
+                    showscale=True,
+                    colorbar=dict(title=truncate(colorby)),
+                ),
+            )
+        )
+        return fig
+
+    groups = {'': np.arange(len(df))}
+    if colorby is not None:
+        groups = group_indices(df[colorby])
+
+    for group, idx in groups.items():
+        fig.add_trace(
+            trace_type(
+                **coords(idx),
+                name=truncate(group),
+                mode=mode,
+                marker=dict(
+                    opacity=0.6,
+                ),
+            )
+        )
+    return fig
+
+
+def scatter_groups(df, colorby=None, show_lines=False, max_points=MAX_POINTS):
+    """
+    Trace labels of `build_scatter(df, ...)` when its traces can later be
+    extended in place with appended rows, else None (sampled, sorted lines,
+    continuous color or a collapsed "other" group).
+    """
+    if show_lines or len(df) > max_points:
+        return None
+    if colorby is None:
+        return ['']
+    if is_continuous(df[colorby]):
+        return None
+    groups = list(group_indices(df[colorby]))
+    return None if OTHER in groups else groups
+
+
+def extend_scatter(rows, groups, xaxis, yaxis, zaxis=None, colorby=None):
+    """`extendData` payload adding `rows` to the traces of a `scatter_groups` figure."""
+    positions = new_row_labels(rows, colorby, groups)
+    if positions is None:
+        return None
+    axes = {'x': xaxis, 'y': yaxis}
+    if zaxis is not None:
+        axes['z'] = zaxis
+    update = {
+        axis: [rows[col].values[positions[group]] for group in groups]
+        for axis, col in axes.items()
+    }
+    return [update, list(range(len(groups)))]
+
+
+POLAR_MODES = {
+    'tracks': "Tracks",
+    'mean': "Mean",
+    'median': "Median",
+    'iqr': "IQR envelope",
+}
+
+
+# overlay traces marking a selected track and its most similar tracks; the
+# clientside chart callbacks leave traces with this `meta` alone
+HIGHLIGHT = 'highlight'
+SELECTED_COLOR = '#40c057'
+SIMILAR_COLOR = '#ffffff'
+
+
+def highlight_scatter(df, selected, similar, xaxis, yaxis, zaxis=None):
+    """Traces to append to a scatter figure, marking `selected` and `similar` rows."""
+    trace_type = go.Scatter3d if zaxis is not None else go.Scatter
+    traces = []
+    for name, rows, marker in (
+        ('similar', similar, dict(size=10, symbol='circle-open', color=SIMILAR_COLOR, line=dict(width=2))),
+        ('selected', [selected], dict(size=12, symbol='diamond', color=SELECTED_COLOR)),
+    ):
+        sub = df.iloc[rows]
+        xyz = dict(x=sub[xaxis].values, y=sub[yaxis].values)
+        if zaxis is not None:
+            xyz['z'] = sub[zaxis].values
+        traces.append(trace_type(
+            **xyz,
+            mode='markers',
+            marker=marker,
+            name=name,
+            text=sub['name'].values if 'name' in sub else None,
+            meta=HIGHLIGHT,
+        ).to_plotly_json())
+    return traces
+
+
+def highlight_polar(matrix, selected, similar, dims):
+    """Traces to append to a polar figure, outlining `selected` and `similar` rows."""
+    return [
+        go.Scatterpolar(
+            **polar_trace(matrix[rows], dims),
+            mode='lines',
+            line=dict(color=color, width=width),
+            name=name,
+            meta=HIGHLIGHT,
+        ).to_plotly_json()
+        for name, rows, color, width in (
+            ('similar', similar, SIMILAR_COLOR, 1),
+            ('selected', [selected], SELECTED_COLOR, 3),
+        )
+    ]
+
+
+def with_traces(fig, traces):
+    """A copy of figure dict `fig` with `traces` drawn on top."""
+    return dict(fig, data=list(fig.get('data', [])) + traces)
+
+
+def feature_matrix(df, dims):
+    """Tracks x dims float matrix for the polar/radar views."""
+    return df[dims].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+
+def _closed(values):
+    # repeat the first dimension so each polygon closes on itself
+    return np.concatenate([values, values[..., :1]], axis=-1)
+
+
+def polar_trace(matrix, dims, aggregate='tracks'):
+    """Build the r/theta arrays for one group's rows of the feature matrix."""
+    theta = dims + dims[:1]
+    if aggregate == 'mean':
+        return dict(r=_closed(np.nanmean(matrix, axis=0)), theta=theta)
+    if aggregate == 'median':
+        return dict(r=_closed(np.nanmedian(matrix, axis=0)), theta=theta)
+    if aggregate == 'iqr':
+        q25, q75 = np.nanpercentile(matrix, [25, 75], axis=0)
+        # trace the upper quartile, then the lower one in reverse to fill a band
+        return dict(
+            r=np.concatenate([_closed(q75), _closed(q25)[::-1]]),
+            theta=theta + theta[::-1],
+        )
+
+    # one closed polygon per track, separated by gaps; drawn as plain markers
+    # too, so lines can be toggled in the browser without new data
+    n = len(matrix)
+    r = np.concatenate([_closed(matrix), np.full((n, 1), np.nan)], axis=1)
+    theta = np.tile(np.array(theta + [None], dtype=object), n)
+    return dict(r=r.ravel(), theta=theta)
+
+
+def extend_polar(matrix, rows, groups, dims, colorby=None):
+    """`extendData` payload adding new feature `matrix` rows to a per-track polar figure."""
+    positions = new_row_labels(rows, colorby, groups)
+    if positions is None:
+        return None
+    traces = [polar_trace(matrix[positions[group]], dims, 'tracks') for group in groups]
+    update = {
+        'r': [t['r'] for t in traces],
+        'theta': [t['theta'] for t in traces],
+    }
+    return [update, list(range(len(groups)))]
+
+
+def build_polar(matrix, dims, groups, range_min=None, range_max=None,
+                show_lines=True, aggregate='tracks'):
+    fig = base_figure(
+        margin=dict(t=10, l=0, r=0, b=10),
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[range_min, range_max]
+            )
+        ),
+    )
+
+    mode = 'markers'
+    fill = None
+    if show_lines:
+        mode = 'markers+lines'
+        fill = 'toself'
+
+    aggregated = aggregate in ('mean', 'median', 'iqr')
+    trace_type = go.Scatterpolar if aggregated else go.Scatterpolargl
+    if aggregate == 'iqr':
+        mode = 'lines'
+
+    for group, idx in groups.items():
+        if not len(idx):
+            continue
+        fig.add_trace(
+            trace_type(
+                **polar_trace(matrix[idx], dims, aggregate),
+                marker=dict(
+                    opacity=0.5,
+                ),
+                fill=fill,
+                mode=mode,
+                name=truncate(group),
+            ),
+        )
+    return fig
+
+
+def ternary_coords(df, dims):
+    """
+    Each row's `dims` normalized to sum to 1 (negatives count as 0), and a
+    mask of the rows that could be placed at all.
+    """
+    matrix = np.clip(feature_matrix(df, dims), 0, None)
+    total = matrix.sum(axis=1)
+    valid = np.isfinite(total) & (total > 0)
+    coords = np.zeros_like(matrix)
+    coords[valid] = matrix[valid] / total[valid, None]
+    return coords, valid
+
+
+def ternary_bins(coords, n_bins=TERNARY_BINS):
+    """
+    Count `coords` into a triangular grid with `n_bins` cells per side:
+    returns `(centers, counts, upward)` for the non-empty cells, centers
+    being barycentric `(a, b, c)`.
+    """
+    scaled = coords[:, :2] * n_bins
+    cell = np.minimum(np.floor(scaled), n_bins - 1).astype(np.int64)
+    # a cell's lower-left half is an upward triangle, its upper-right half a downward one
+    upward = (scaled - cell).sum(axis=1) < 1
+    i, j = cell[:, 0], cell[:, 1]
+    overflow = i + j > n_bins - 1 - (~upward)
+    upward[overflow & ~upward] = True
+    i = np.where(i + j > n_bins - 1, n_bins - 1 - j, i)
+
+    ids = (i * n_bins + j) * 2 + upward
+    counts = np.bincount(ids, minlength=2 * n_bins * n_bins)
+    filled = np.flatnonzero(counts)
+    up = (filled % 2).astype(bool)
+    fi, fj = (filled // 2) // n_bins, (filled // 2) % n_bins
+    offset = np.where(up, 1 / 3, 2 / 3)
+    a = (fi + offset) / n_bins
+    b = (fj + offset) / n_bins
+    centers = np.stack([a, b, 1 - a - b], axis=1)
+    return centers, counts[filled], up
+
+
+def ternary_density(df, dims, n_bins=TERNARY_BINS):
+    coords, valid = ternary_coords(df, dims)
+    return ternary_bins(coords[valid], n_bins)
+
+
+def build_ternary(df, dims, groups=None, density=None, n_bins=TERNARY_BINS):
+    """
+    Ternary scatter of `df`'s `dims` per `groups`, or, given `density`
+    (the output of `ternary_bins`), one marker per non-empty bin colored
+    by its track count.
+    """
+    fig = base_figure(
+        margin=dict(t=40, l=40, r=40, b=40),
+        ternary=dict(
+            aaxis=dict(title=truncate(dims[0])),
+            baxis=dict(title=truncate(dims[1])),
+            caxis=dict(title=truncate(dims[2])),
+        ),
+    )
+    if density is not None:
+        centers, counts, upward = density
+        for symbol, mask in (('triangle-up', upward), ('triangle-down', ~upward)):
+            fig.add_trace(go.Scatterternary(
+                a=centers[mask, 0], b=centers[mask, 1], c=centers[mask, 2],
+                mode='markers',
+                name=symbol,
+                showlegend=False,
+                hovertemplate="%{marker.color} track(s)<extra></extra>",
+                marker=dict(
+                    symbol=symbol,
+                    size=max(4, 500 // n_bins),
+                    color=counts[mask],
+                    coloraxis='coloraxis',
+                ),
+            ))
+        fig.update_layout(
+            coloraxis=dict(colorscale='Viridis', colorbar=dict(title="tracks")),
+            title=dict(text=f"density of {int(counts.sum()):,} tracks", font=dict(size=12)),
+        )
+        return fig
+
+    coords, valid = ternary_coords(df, dims)
+    for group, idx in (groups or {'': np.arange(len(df))}).items():
+        idx = idx[valid[idx]]
+        if not len(idx):
+            continue
+        fig.add_trace(go.Scatterternary(
+            a=coords[idx, 0], b=coords[idx, 1], c=coords[idx, 2],
+            mode='markers',
+            name=truncate(group),
+            marker=dict(opacity=0.6),
+        ))
+    return fig
+
+
+def build_overlap(playlists, matrix, measure, title):
+    """Heatmap of a playlist x playlist overlap `matrix`."""
+    jaccard = measure.endswith('jaccard')
+    fig = base_figure(
+        margin=dict(t=40, l=40, r=40, b=40),
+        title=dict(text=title, font=dict(size=12)),
+        xaxis=dict(automargin=True),
+        yaxis=dict(autorange='reversed', automargin=True),
+    )
+    fig.add_trace(go.Heatmap(
+        z=matrix,
+        x=playlists,
+        y=playlists,
+        colorscale='Viridis',
+        hovertemplate=(
+            "%{y}<br>%{x}<br>" + ("%{z:.0%}" if jaccard else "%{z:,}") + "<extra></extra>"
+        ),
+    ))
+    return fig
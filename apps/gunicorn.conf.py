@@ -0,0 +1,21 @@
+# production server settings, e.g. `gunicorn app:server -c gunicorn.conf.py`
+import multiprocessing
+import os
+
+
+# sign-ins, job status and datasets are per process with the `memory` backend,
+# so a request landing on another worker would lose them
+shared = os.environ.get('SPOTIVIZ_CACHE_BACKEND', 'memory') != 'memory'
+
+bind = os.environ.get('SPOTIVIZ_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('SPOTIVIZ_WORKERS', multiprocessing.cpu_count() if shared else 1))
+threads = int(os.environ.get('SPOTIVIZ_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('SPOTIVIZ_TIMEOUT', 120))
+accesslog = os.environ.get('SPOTIVIZ_ACCESS_LOG', '-')
+
+if workers > 1 and not shared:
+    raise RuntimeError(
+        f"SPOTIVIZ_WORKERS={workers} needs a shared SPOTIVIZ_CACHE_BACKEND (`file` or `redis`), "
+        "or sign-ins and datasets won't be seen by every worker"
+    )
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+import os
+import time
+import uuid
+
+import backends
+
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = int(os.environ.get('SPOTIVIZ_JOB_WORKERS', 2))
+# finished job statuses are kept this long for late polls
+STATUS_TTL = 10 * 60
+# minimum seconds between progress writes to the status backend
+PROGRESS_INTERVAL = 0.25
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Handle passed to a running job for reporting progress and noticing cancellation."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.progress = {}
+        self.partial = None
+        self._last_write = 0
+
+    def cancelled(self):
+        return bool(self.queue.backend.get(f"cancel:{self.id}"))
+
+    def check(self):
+        """Raise `JobCancelled` if superseded, e.g. before storing a result."""
+        if self.cancelled():
+            raise JobCancelled(self.id)
+
+    def report(self, name, done, total):
+        """Record `done`/`total` for one part of the job; raises `JobCancelled` if superseded."""
+        self.progress[name] = [done, total]
+        if time.time() - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = time.time()
+            self.queue._set_status(self.id, 'running', progress=self.progress, partial=self.partial)
+        self.check()
+
+    def publish(self, partial):
+        """Make an intermediate result available to pollers before the job finishes."""
+        self.partial = partial
+        self._last_write = time.time()
+        self.queue._set_status(self.id, 'running', progress=self.progress, partial=partial)
+
+
+class JobQueue:
+    """
+    Local thread-pool job queue. Job status lives in `backend`, so with a
+    shared backend any worker process can poll or cancel a job.
+    """
+
+    def __init__(self, backend, max_workers=MAX_JOBS):
+        self.backend = backend
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _set_status(self, job_id, state, **fields):
+        status = {'state': state, 'progress': {}, 'partial': None, 'result': None, 'error': None}
+        status.update(fields)
+        self.backend.set(f"status:{job_id}", status, ttl=STATUS_TTL)
+
+    def submit(self, fn, owner=None):
+        """
+        Run `fn(job)` in the background and return its job ID. Submitting a
+        new job for the same `owner` cancels the owner's previous one.
+        """
+        if owner is not None:
+            self.cancel_owner(owner)
+
+        job_id = uuid.uuid4().hex
+        self._set_status(job_id, 'queued')
+        if owner is not None:
+            self.backend.set(f"owner:{owner}", job_id, ttl=STATUS_TTL)
+        self._pool.submit(self._run, Job(self, job_id), fn)
+        return job_id
+
+    def _run(self, job, fn):
+        if job.cancelled():
+            self._set_status(job.id, 'cancelled')
+            return
+        self._set_status(job.id, 'running')
+        start = time.perf_counter()
+        try:
+            result = fn(job)
+        except JobCancelled:
+            logger.info(f"job {job.id[:8]} cancelled after {time.perf_counter() - start:.1f}s")
+            self._set_status(job.id, 'cancelled', progress=job.progress)
+            return
+        except Exception as e:
+            logger.exception(f"job {job.id[:8]} failed")
+            self._set_status(job.id, 'failed', progress=job.progress, error=str(e))
+            return
+        logger.info(f"job {job.id[:8]} finished in {time.perf_counter() - start:.1f}s")
+        self._set_status(job.id, 'done', progress=job.progress, result=result)
+
+    def status(self, job_id):
+        if not job_id:
+            return None
+        return self.backend.get(f"status:{job_id}")
+
+    def cancel(self, job_id):
+        self.backend.set(f"cancel:{job_id}", True, ttl=STATUS_TTL)
+
+    def cancel_owner(self, owner):
+        job_id = self.backend.get(f"owner:{owner}")
+        if job_id:
+            self.cancel(job_id)
+
+
+QUEUE = JobQueue(backends.get_backend('jobs', max_items=10000))
+
+
+def submit(fn, owner=None):
+    return QUEUE.submit(fn, owner=owner)
+
+
+def status(job_id):
+    return QUEUE.status(job_id)
+
+
+def cancel_owner(owner):
+    QUEUE.cancel_owner(owner)
@@ -2,6 +2,8 @@ from dash import dash_table, dcc, html
 
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
+import figures
+import overlap
 
 
 GREEN = '#40c057'
@@ -78,17 +80,27 @@ polarplot_tab = dbc.Tab(
     label='Polar',
     children=[
         dbc.Row([
-            dbc.Col(dbc.FormText("Dimensions (theta)"), width=6),
+            dbc.Col(dbc.FormText("Dimensions (theta)"), width=4),
             dbc.Col(dbc.FormText("Range")),
             dbc.Col(),
             dbc.Col(dbc.FormText("Colorby")),
+            dbc.Col(dbc.FormText("Show")),
             dbc.Col(dbc.FormText("")),
         ]),
         dbc.Row([
-            dbc.Col(dcc.Dropdown(id='polar-dims', multi=True), width=6),
+            dbc.Col(dcc.Dropdown(id='polar-dims', multi=True), width=4),
             dbc.Col(dbc.Input(id='polar-range-min', type='number')),
             dbc.Col(dbc.Input(id='polar-range-max', type='number')),
             dbc.Col(dcc.Dropdown(id='polar-colorby')),
+            dbc.Col(dcc.Dropdown(
+                id='polar-aggregate',
+                options=[
+                    {'label': label, 'value': value}
+                    for value, label in figures.POLAR_MODES.items()
+                ],
+                value='tracks',
+                clearable=False,
+            )),
             dbc.Col(dbc.Switch(
                 id='polar-showlines',
                 label="Fill?",
@@ -103,12 +115,80 @@ polarplot_tab = dbc.Tab(
     style={'padding': '1rem'}
 )
 
+map_tab = dbc.Tab(
+    label_style=LABEL_STYLE,
+    active_label_style=ACTIVE_LABEL_STYLE,
+    label='Map',
+    children=[
+        dbc.Row([
+            dbc.Col(dbc.FormText("Projection of all audio features (PCA)")),
+            dbc.Col(dbc.FormText("Colorby")),
+        ]),
+        dbc.Row([
+            dbc.Col(dbc.RadioItems(
+                id='map-dims',
+                options=[{'label': "2D", 'value': 2}, {'label': "3D", 'value': 3}],
+                value=2,
+                inline=True,
+            )),
+            dbc.Col(dcc.Dropdown(id='map-colorby')),
+        ]),
+        html.Div(
+            dcc.Graph(id='map'),
+            className='my-4',
+        ),
+    ],
+    style={'padding': '1rem'}
+)
+
 ternaryplot_tab = dbc.Tab(
     label_style=LABEL_STYLE,
     active_label_style=ACTIVE_LABEL_STYLE,
     label='Ternary',
     children=[
+        dbc.Row([
+            dbc.Col(dbc.FormText("A")),
+            dbc.Col(dbc.FormText("B")),
+            dbc.Col(dbc.FormText("C")),
+            dbc.Col(dbc.FormText("Colorby")),
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id='ternary-a')),
+            dbc.Col(dcc.Dropdown(id='ternary-b')),
+            dbc.Col(dcc.Dropdown(id='ternary-c')),
+            dbc.Col(dcc.Dropdown(id='ternary-colorby')),
+        ]),
+        html.Div(
+            dcc.Graph(id='ternary'),
+            className='my-4',
+        ),
+    ],
+    style={'padding': '1rem'}
+)
 
+overlap_tab = dbc.Tab(
+    label_style=LABEL_STYLE,
+    active_label_style=ACTIVE_LABEL_STYLE,
+    label='Overlap',
+    children=[
+        dbc.Row([
+            dbc.Col(dbc.FormText("Overlap of the selected playlists (tracks match by ISRC)")),
+        ]),
+        dbc.Row([
+            dbc.Col(dbc.RadioItems(
+                id='overlap-measure',
+                options=[
+                    {'label': label, 'value': value}
+                    for value, label in overlap.MEASURES.items()
+                ],
+                value='tracks',
+                inline=True,
+            )),
+        ]),
+        html.Div(
+            dcc.Graph(id='overlap'),
+            className='my-4',
+        ),
     ],
     style={'padding': '1rem'}
 )
@@ -117,7 +197,9 @@ visualizations = dbc.Tabs(
     [
         scatterplot_tab,
         polarplot_tab,
+        map_tab,
         ternaryplot_tab,
+        overlap_tab,
     ],
     style={
         'border-width': '0px',
@@ -130,25 +212,70 @@ sidebar = html.Div(
         html.H3("Spotiviz", style={'color': 'white'}),
         html.P("This is a demo dash app to visualize various aspects of the Spotify API with plotly and dash."),
         html.Hr(),
+        dbc.Input(
+            id='playlist-search',
+            type='search',
+            placeholder='Search playlists',
+            size='sm',
+            className='mb-2',
+        ),
         html.Div(
-            dmc.Chips(
-                id='playlists',
-                data=[],
-                direction='column',
-                color='green',
-                multiple=True,
-                size='xs',
-                variant='filled',
-                # style={
-                #     'color': 'white',
-                #     'background-color': 'black'
-                # }
-            ),
+            [
+                dmc.Chips(
+                    id='playlists',
+                    data=[],
+                    direction='column',
+                    color='green',
+                    multiple=True,
+                    size='xs',
+                    variant='filled',
+                    # style={
+                    #     'color': 'white',
+                    #     'background-color': 'black'
+                    # }
+                ),
+                html.Div(
+                    dbc.Button(
+                        "Load more",
+                        id='playlists-more',
+                        color='link',
+                        size='sm',
+                    ),
+                    id='playlists-more-div',
+                    hidden=True,
+                ),
+            ],
             style={
                 'height': '60%',
                 'overflow-y': 'auto',
             }
         ),
+        dcc.Interval(id='catalog-poll', interval=500, disabled=True),
+        dcc.Store(id='catalog-job'),
+        dcc.Store(id='playlists-limit'),
+        html.Div(
+            [
+                dbc.Progress(
+                    id='load-progress',
+                    value=0,
+                    color='success',
+                    striped=True,
+                    animated=True,
+                ),
+                html.Div(
+                    id='load-status',
+                    style={'color': '#ccc', 'fontSize': '11px'},
+                ),
+            ],
+            id='load-progress-div',
+            className='my-2',
+            hidden=True,
+        ),
+        dcc.Interval(id='load-poll', interval=500, disabled=True),
+        dcc.Store(id='load-job'),
+        # ticks once per artist lookup started from the dropdowns (see `request_artist_columns`)
+        dcc.Interval(id='artist-poll', interval=100, max_intervals=0),
+        dcc.Store(id='artist-job'),
         html.Div(
             dcc.Loading(
                 html.Div(
@@ -205,14 +332,32 @@ content = html.Div(
                     'album.available_markets',
                     'available_markets',
                 ],
-                filter_action="native",
-                sort_action="native",
+                # paging/filtering/sorting happen server-side (see `show_table`)
+                page_action="custom",
+                page_current=0,
+                filter_action="custom",
+                filter_query="",
+                sort_action="custom",
+                sort_by=[],
                 sort_mode="multi",
-                #row_selectable="single",
+                # selecting a track lists the tracks that sound most like it (see `find_similar_tracks`)
+                row_selectable="single",
+                selected_rows=[],
             ),
             className='my-4',
         ),
+        html.Div(id='similar-tracks-list', className='mb-4'),
         dcc.Store(id='track-data'),
+        dcc.Store(id='scatter-state'),
+        dcc.Store(id='map-state'),
+        dcc.Store(id='polar-state'),
+        dcc.Store(id='similar-tracks'),
+        # whether an artist column is picked, which has them looked up (see `request_artist_columns`)
+        dcc.Store(id='artist-columns'),
+        # outputs of the clientside chart callbacks, which only restyle the figures
+        dcc.Store(id='scatter-style'),
+        dcc.Store(id='polar-style'),
+        dcc.Store(id='polar-range'),
     ],
     id='data-div',
     className="py-4",
@@ -0,0 +1,248 @@
+from urllib import parse
+
+import bisect
+import functools
+import logging
+import re
+import threading
+import time
+
+import dash
+import flask
+import urllib3
+
+
+logger = logging.getLogger(__name__)
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# bytes
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, '') for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {k: (list(c), s) for k, (c, s) in self._values.items()}
+        names = self.labelnames + ('le',)
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                yield f"{self.name}_bucket{_labels(names, key + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+CALLBACK_SECONDS = _register(Histogram(
+    'spotiviz_callback_seconds', "Dash callback latency", ['callback'],
+))
+CALLBACK_ERRORS = _register(Counter(
+    'spotiviz_callback_errors_total', "Dash callbacks that raised", ['callback'],
+))
+CALLBACK_RESPONSE_BYTES = _register(Histogram(
+    'spotiviz_callback_response_bytes', "Dash callback response payload size", ['callback'],
+    buckets=SIZE_BUCKETS,
+))
+API_SECONDS = _register(Histogram(
+    'spotiviz_api_seconds', "Spotify Web API request latency", ['endpoint'],
+))
+API_CALLS = _register(Counter(
+    'spotiviz_api_calls_total', "Spotify Web API requests by endpoint and status", ['endpoint', 'status'],
+))
+API_RETRIES = _register(Counter(
+    'spotiviz_api_retries_total', "Spotify Web API requests retried inside spotipy (429s, 5xx)", ['endpoint', 'status'],
+))
+CACHE_REQUESTS = _register(Counter(
+    'spotiviz_cache_requests_total', "Cache lookups by cache and result (hit/miss)", ['cache', 'result'],
+))
+DATASETS = _register(Gauge(
+    'spotiviz_datasets', "Track datasets held in this process",
+))
+DATASET_BYTES = _register(Gauge(
+    'spotiviz_dataset_bytes', "Memory used by the track datasets held in this process",
+))
+
+
+def cache_result(cache, hit, count=1):
+    CACHE_REQUESTS.inc(count, cache=cache, result='hit' if hit else 'miss')
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def timed_callback(fn):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if flask.has_request_context():
+            flask.g.spotiviz_callback = name
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except dash.exceptions.PreventUpdate:
+            raise
+        except Exception:
+            CALLBACK_ERRORS.inc(callback=name)
+            raise
+        finally:
+            CALLBACK_SECONDS.observe(time.perf_counter() - start, callback=name)
+    return wrapper
+
+
+class InstrumentedApp:
+    """Proxy for a Dash app whose `callback` decorator times every callback it registers."""
+
+    def __init__(self, app):
+        self._app = app
+
+    def __getattr__(self, name):
+        return getattr(self._app, name)
+
+    def callback(self, *args, **kwargs):
+        register = self._app.callback(*args, **kwargs)
+        return lambda fn: register(timed_callback(fn))
+
+
+# path segments following these are IDs, collapsed so endpoints group together
+ID_PARENTS = {'playlists', 'artists', 'albums', 'tracks', 'users', 'audio-features', 'audio-analysis'}
+
+
+def endpoint(url):
+    """`https://api.spotify.com/v1/playlists/abc/tracks?x=1` -> `playlists/{id}/tracks`."""
+    path = parse.urlparse(url).path.strip('/')
+    segments = path.split('/')
+    if segments and re.fullmatch(r"v\d+", segments[0]):
+        segments = segments[1:]
+    out = []
+    for i, segment in enumerate(segments):
+        out.append('{id}' if i and segments[i - 1] in ID_PARENTS and segment else segment)
+    return '/'.join(out)
+
+
+class CountingRetry(urllib3.Retry):
+
+    def increment(self, method=None, url=None, response=None, *args, **kwargs):
+        status = response.status if response is not None else 'error'
+        API_RETRIES.inc(endpoint=endpoint(url or ''), status=status)
+        return super().increment(method, url, response, *args, **kwargs)
+
+
+def instrument_client(client):
+    """Count and time every request a spotipy client makes."""
+    # urllib3 retries 429s (honouring `Retry-After`) and 5xx before spotipy sees them
+    for adapter in client._session.adapters.values():
+        adapter.max_retries.__class__ = CountingRetry
+
+    internal_call = client._internal_call
+
+    def timed_call(method, url, payload, params):
+        name = endpoint(url if url.startswith('http') else client.prefix + url)
+        start = time.perf_counter()
+        status = 200
+        try:
+            return internal_call(method, url, payload, params)
+        except Exception as e:
+            status = getattr(e, 'http_status', None) or 'error'
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, endpoint=name)
+            API_CALLS.inc(endpoint=name, status=status)
+
+    client._internal_call = timed_call
+    return client
+
+
+def init_server(server):
+    """Serve `/metrics` from the Flask `server` and record Dash response sizes."""
+
+    @server.after_request
+    def record_response_size(response):
+        name = flask.g.get('spotiviz_callback')
+        if name and not response.direct_passthrough:
+            CALLBACK_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, callback=name)
+        return response
+
+    @server.route('/metrics')
+    def serve_metrics():
+        return flask.Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,281 @@
+from collections import namedtuple
+
+import logging
+import os
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# `slim` requests and keeps only the columns the app uses; `full` keeps every
+# field of the API responses (handy for debugging)
+FIELDS = os.environ.get('SPOTIVIZ_FIELDS', 'slim')
+MODES = ('slim', 'full')
+
+AUDIO_FEATURES = [
+    'acousticness',
+    'analysis_url',
+    'danceability',
+    'duration_ms',
+    'energy',
+    'id',
+    'instrumentalness',
+    'key',
+    'liveness',
+    'loudness',
+    'mode',
+    'speechiness',
+    'tempo',
+    'time_signature',
+    'track_href',
+    'type',
+    'uri',
+    'valence',
+]
+# audio feature fields that only repeat the track's identity/links
+FULL_ONLY_AUDIO_FEATURES = {'analysis_url', 'id', 'track_href', 'type', 'uri'}
+
+
+def _nested(*keys):
+    def extract(obj):
+        for key in keys:
+            if not isinstance(obj, dict):
+                return None
+            obj = obj.get(key)
+        return obj
+    return extract
+
+
+def _artist_names(key):
+    def extract(obj):
+        return ", ".join(sorted(a['name'] for a in obj.get(key) or [] if a.get('name')))
+    return extract
+
+
+def _artist_ids(key):
+    def extract(obj):
+        return ", ".join(sorted(a['id'] for a in obj.get(key) or [] if a.get('id')))
+    return extract
+
+
+def _joined(key):
+    def extract(obj):
+        return "/".join(obj.get(key) or [])
+    return extract
+
+
+# `source` is the playlist item, its track, the track's album or the track's
+# audio features; `key` is a field name or an extractor. `fields` is what the
+# column reads in Spotify's `fields` syntax (defaults to `key`), `slim` keeps
+# it in slim mode and `hidden` hides it in the table by default.
+Column = namedtuple('Column', ['source', 'key', 'fields', 'slim', 'hidden'])
+
+
+def column(source, key, fields=None, slim=True, hidden=False):
+    return Column(source, key, fields or key, slim, hidden)
+
+
+COLUMNS = {
+    'added_at': column('item', 'added_at'),
+    'is_local': column('item', 'is_local'),
+    'album.album_type': column('album', 'album_type'),
+    'album.available_markets': column(
+        'album', _joined('available_markets'), 'available_markets', slim=False, hidden=True
+    ),
+    'album.external_urls.spotify': column(
+        'album', _nested('external_urls', 'spotify'), 'external_urls', slim=False, hidden=True
+    ),
+    'album.href': column('album', 'href', slim=False, hidden=True),
+    'album.id': column('album', 'id', hidden=True),
+    'album.name': column('album', 'name'),
+    'album.release_date': column('album', 'release_date'),
+    'album.release_date_precision': column('album', 'release_date_precision'),
+    'album.total_tracks': column('album', 'total_tracks'),
+    'album.type': column('album', 'type', slim=False),
+    'album.uri': column('album', 'uri', slim=False, hidden=True),
+    'artists': column('track', _artist_names('artists'), 'artists(id,name)'),
+    'artists.id': column('track', _artist_ids('artists'), 'artists(id,name)', hidden=True),
+    'available_markets': column(
+        'track', _joined('available_markets'), 'available_markets', slim=False, hidden=True
+    ),
+    'disc_number': column('track', 'disc_number'),
+    'duration_ms': column('track', 'duration_ms'),
+    'explicit': column('track', 'explicit'),
+    'external_ids.isrc': column(
+        'track', _nested('external_ids', 'isrc'), 'external_ids(isrc)', hidden=True
+    ),
+    'external_urls.spotify': column(
+        'track', _nested('external_urls', 'spotify'), 'external_urls', slim=False, hidden=True
+    ),
+    'href': column('track', 'href', slim=False, hidden=True),
+    'id': column('track', 'id', hidden=True),
+    'name': column('track', 'name'),
+    'popularity': column('track', 'popularity'),
+    'preview_url': column('track', 'preview_url', slim=False, hidden=True),
+    'track_number': column('track', 'track_number'),
+    'type': column('track', 'type', slim=False),
+    'uri': column('track', 'uri'),
+}
+COLUMNS.update({
+    f"audio_feature.{f}": column(
+        'feature', f,
+        slim=f not in FULL_ONLY_AUDIO_FEATURES,
+        hidden=f in ('analysis_url', 'id', 'track_href', 'uri'),
+    )
+    for f in AUDIO_FEATURES
+})
+
+# fields the fetch/dedupe code itself relies on, whatever the columns
+REQUIRED_FIELDS = {
+    'item': ['is_local'],
+    'track': ['id', 'uri', 'is_local'],
+    'album': [],
+}
+
+
+def columns(mode=FIELDS):
+    """The `COLUMNS` kept in `mode`."""
+    if mode not in MODES:
+        raise ValueError(f"unknown SPOTIVIZ_FIELDS mode: {mode}")
+    return {col: spec for col, spec in COLUMNS.items() if mode == 'full' or spec.slim}
+
+
+def hidden_columns(names):
+    """The columns of `names` hidden in the table by default."""
+    return [c for c in names if c in COLUMNS and COLUMNS[c].hidden]
+
+
+def api_fields(mode=FIELDS):
+    """
+    The `fields` filter for `playlist_items` pages that returns just what
+    `mode`'s columns read, or None for full responses.
+    """
+    if mode == 'full':
+        return None
+    parts = {source: list(fields) for source, fields in REQUIRED_FIELDS.items()}
+    for spec in columns(mode).values():
+        if spec.source in parts and spec.fields not in parts[spec.source]:
+            parts[spec.source].append(spec.fields)
+
+    album = f"album({','.join(parts['album'])})"
+    track = f"track({','.join(parts['track'] + [album])})"
+    return f"items({','.join(parts['item'] + [track])}),total"
+
+NUMERIC_COLUMNS = [
+    'album.total_tracks',
+    'disc_number',
+    'duration_ms',
+    'popularity',
+    'track_number',
+] + [
+    f"audio_feature.{f}" for f in AUDIO_FEATURES
+    if f not in FULL_ONLY_AUDIO_FEATURES
+]
+DATETIME_COLUMNS = ['added_at', 'album.release_date']
+
+# the compact in-memory schema: repeated strings as categoricals (market lists
+# included, since most tracks share one), whole numbers as small ints when
+# nothing is missing and audio features as float32
+CATEGORY_COLUMNS = [
+    'user_playlist',
+    'artists',
+    'artists.id',
+    'album.album_type',
+    'album.available_markets',
+    'album.id',
+    'album.name',
+    'album.release_date_precision',
+    'album.type',
+    'available_markets',
+    'type',
+]
+INTEGER_COLUMNS = ['album.total_tracks', 'disc_number', 'duration_ms', 'popularity', 'track_number']
+BOOL_COLUMNS = ['explicit', 'is_local']
+FLOAT32_COLUMNS = [c for c in NUMERIC_COLUMNS if c.startswith('audio_feature.')]
+
+
+def display_names(playlist_names):
+    """
+    `playlist_names` with repeated names numbered ("Favorites", "Favorites (2)")
+    so playlists that share a name stay apart.
+    """
+    names = {}
+    taken = set()
+    for playlist_id, name in playlist_names.items():
+        unique, n = name, 1
+        while unique in taken:
+            n += 1
+            unique = f"{name} ({n})"
+        taken.add(unique)
+        names[playlist_id] = unique
+    return names
+
+
+def dedupe(playlist_tracks, playlist_names, seen=None):
+    """
+    Flatten `{playlist_id: [(playlist_track, feat), ...]}`, keeping one row
+    per (track, playlist). Pass the same `seen` set across batches to
+    dedupe incrementally.
+    """
+    seen = set() if seen is None else seen
+    playlist_names = display_names(playlist_names)
+    items = []
+    for playlist_id, pairs in playlist_tracks.items():
+        playlist_name = playlist_names.get(playlist_id, playlist_id)
+        for playlist_track, feat in pairs:
+            track = playlist_track['track']
+            key = (track.get('id') or track.get('uri'), playlist_id)
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append((playlist_track, feat, playlist_name))
+    return items
+
+
+def compact(df):
+    """Convert `df`'s known columns to the compact schema, in place; returns `df`."""
+    for col in CATEGORY_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in FLOAT32_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype('float32')
+    for col in INTEGER_COLUMNS:
+        if col in df:
+            if df[col].notna().all():
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+            else:
+                df[col] = df[col].astype('float32')
+    for col in BOOL_COLUMNS:
+        if col in df and df[col].notna().all():
+            df[col] = df[col].astype(bool)
+    return df
+
+
+def normalize(playlist_tracks, playlist_names, seen=None, mode=FIELDS):
+    items = dedupe(playlist_tracks, playlist_names, seen=seen)
+    sources = {'item': [i[0] for i in items]}
+    sources['track'] = [i['track'] for i in sources['item']]
+    sources['album'] = [t.get('album') or {} for t in sources['track']]
+    sources['feature'] = [i[1] or {} for i in items]
+
+    data = {}
+    for col, spec in columns(mode).items():
+        if callable(spec.key):
+            data[col] = [spec.key(obj) for obj in sources[spec.source]]
+        else:
+            data[col] = [obj.get(spec.key) for obj in sources[spec.source]]
+    data['user_playlist'] = [i[2] for i in items]
+
+    df = pd.DataFrame(data)
+    for col in NUMERIC_COLUMNS:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    for col in DATETIME_COLUMNS:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    df = compact(df)
+
+    logger.info(f"normalized {len(df)} row(s) from {sum(len(v) for v in playlist_tracks.values())} track(s)")
+    return df
@@ -0,0 +1,167 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import datasets
+
+
+logger = logging.getLogger(__name__)
+
+# items in more than this share of the playlists are counted with a dense
+# incidence matrix product, the rest playlist pair by playlist pair
+DENSE_SHARE = 1 / 16
+# playlist pairs (or incidence matrix cells) counted at a time, bounding memory
+CHUNK_SIZE = int(os.environ.get('SPOTIVIZ_OVERLAP_CHUNK_SIZE', 4000000))
+
+MEASURES = {
+    'tracks': "Shared tracks",
+    'artists': "Shared artists",
+    'tracks_jaccard': "Track similarity (Jaccard)",
+    'artists_jaccard': "Artist similarity (Jaccard)",
+}
+
+
+def _codes(series):
+    """`(codes, uniques)` of `series`, -1 coding missing values."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(dtype=np.int64), np.asarray(series.cat.categories, dtype=object)
+    codes, uniques = pd.factorize(series)
+    return codes.astype(np.int64), np.asarray(uniques, dtype=object)
+
+
+def _blank(series):
+    return series.isna().to_numpy() | (series.astype(object) == "").to_numpy()
+
+
+def track_codes(df):
+    """
+    One code per recording: tracks share a code when they have the same ISRC,
+    so the same song released under several track IDs (single, album,
+    compilation) counts as one.
+    """
+    ids, _ = _codes(df['id'])
+    if 'external_ids.isrc' not in df:
+        return ids
+    isrc, uniques = _codes(df['external_ids.isrc'].mask(_blank(df['external_ids.isrc'])))
+    return np.where(isrc >= 0, isrc, np.where(ids >= 0, len(uniques) + ids, -1))
+
+
+def artist_codes(df):
+    """
+    `(rows, artists)`: one pair per artist credited on each row. Artists
+    are matched by ID, or by name for rows without artist IDs (tracks cached
+    before IDs were fetched).
+    """
+    credits = df['artists.id'].astype(object) if 'artists.id' in df else pd.Series(None, index=df.index, dtype=object)
+    if 'artists' in df:
+        credits = credits.mask(_blank(credits), df['artists'].astype(object))
+    codes, uniques = pd.factorize(credits.mask(_blank(credits)))
+
+    # split each distinct credit string once, then gather per row
+    split = [u.split(", ") for u in uniques]
+    lengths = np.array([len(s) for s in split], dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    flat, _ = pd.factorize(pd.Series([a for s in split for a in s], dtype=object))
+
+    rows = np.flatnonzero(codes >= 0)
+    counts = lengths[codes[rows]]
+    offsets = np.repeat(starts[codes[rows]] - (np.cumsum(counts) - counts), counts)
+    return np.repeat(rows, counts), flat[offsets + np.arange(counts.sum())]
+
+
+def _chunks(costs, chunk_size):
+    """Bounds splitting consecutive items of `costs` into chunks of about `chunk_size`."""
+    total = np.cumsum(costs)
+    bounds = np.searchsorted(total, np.arange(chunk_size, total[-1] if len(total) else 0, chunk_size))
+    return [(first, last) for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(costs)]) if last > first]
+
+
+def _pair_counts(playlists, degree, n_playlists):
+    """Playlist pair counts of consecutive item groups with `degree` playlists each."""
+    size = np.repeat(degree, degree)
+    start = np.repeat(np.cumsum(degree) - degree, degree)
+    left = np.repeat(playlists, size)
+    right = playlists[np.repeat(start - (np.cumsum(size) - size), size) + np.arange(size.sum())]
+    return np.bincount(left * n_playlists + right, minlength=n_playlists ** 2).reshape(n_playlists, -1)
+
+
+def cooccurrence(playlists, items, n_playlists, chunk_size=CHUNK_SIZE):
+    """
+    `(shared, sizes)` from parallel (playlist, item) code arrays:
+    `shared[i, j]` is how many distinct items playlists i and j have in
+    common, `sizes[i]` how many playlist i has.
+
+    Only items in several playlists can be shared. Most are in a handful, and
+    are counted by enumerating their playlist pairs (sum of degree squared
+    work); the few in many playlists go through blocks of the dense playlist
+    x item incidence matrix, multiplied with BLAS.
+    """
+    valid = (playlists >= 0) & (items >= 0)
+    pairs = np.unique(items[valid] * n_playlists + playlists[valid])
+    items, playlists = np.divmod(pairs, max(n_playlists, 1))
+    sizes = np.bincount(playlists, minlength=n_playlists)
+    shared = np.zeros((n_playlists, n_playlists), dtype=np.int64)
+
+    # `pairs` is sorted by item, so each item's playlists are consecutive
+    starts = np.flatnonzero(np.r_[True, items[1:] != items[:-1]]) if len(items) else np.array([], dtype=np.int64)
+    degree = np.diff(np.r_[starts, len(items)])
+    dense = degree > max(2, n_playlists * DENSE_SHARE)
+    sparse = (degree > 1) & ~dense
+
+    members, degrees = playlists[np.repeat(sparse, degree)], degree[sparse]
+    offsets = np.r_[0, np.cumsum(degrees)]
+    for first, last in _chunks(degrees ** 2, chunk_size):
+        shared += _pair_counts(members[offsets[first]:offsets[last]], degrees[first:last], n_playlists)
+
+    members, degrees = playlists[np.repeat(dense, degree)], degree[dense]
+    columns = np.repeat(np.arange(len(degrees)), degrees)
+    width = max(1, chunk_size // max(n_playlists, 1))
+    for first in range(0, len(degrees), width):
+        lo, hi = np.searchsorted(columns, [first, first + width])
+        block = np.zeros((n_playlists, min(width, len(degrees) - first)), dtype=np.float32)
+        block[members[lo:hi], columns[lo:hi] - first] = 1
+        shared += (block @ block.T).astype(np.int64)
+
+    np.fill_diagonal(shared, sizes)
+    return shared, sizes
+
+
+def jaccard(shared, sizes):
+    union = sizes[:, None] + sizes[None, :] - shared
+    return np.divide(shared, union, out=np.zeros(shared.shape), where=union > 0)
+
+
+class Overlap:
+    """Pairwise track and artist overlap of a dataset's playlists."""
+
+    def __init__(self, df):
+        codes, names = _codes(df['user_playlist'])
+        # playlists that don't have rows (left over categories) aren't shown
+        present = np.bincount(codes[codes >= 0], minlength=len(names)) > 0
+        order = np.argsort([str(n) for n in names[present]], kind='stable')
+        self.playlists = [str(n) for n in names[present][order]]
+        remap = np.full(len(names) + 1, -1, dtype=np.int64)
+        remap[np.flatnonzero(present)[order]] = np.arange(len(order))
+        codes = remap[codes]
+        n = len(self.playlists)
+
+        self.tracks, self.track_counts = cooccurrence(codes, track_codes(df), n)
+        rows, artists = artist_codes(df)
+        self.artists, self.artist_counts = cooccurrence(codes[rows], artists, n)
+
+    def matrix(self, measure):
+        if measure == 'tracks':
+            return self.tracks
+        if measure == 'artists':
+            return self.artists
+        if measure == 'tracks_jaccard':
+            return jaccard(self.tracks, self.track_counts)
+        if measure == 'artists_jaccard':
+            return jaccard(self.artists, self.artist_counts)
+        raise ValueError(f"unknown overlap measure: {measure}")
+
+
+def overlap(ref):
+    return datasets.derive(ref, 'overlap', Overlap)
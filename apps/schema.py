@@ -0,0 +1,85 @@
+import logging
+import os
+
+import pandas as pd
+
+import normalize
+
+
+logger = logging.getLogger(__name__)
+
+# text columns with more distinct values than this (names, IDs, URLs) aren't offered as colorby
+COLORBY_MAX_VALUES = int(os.environ.get('SPOTIVIZ_COLORBY_MAX_VALUES', 500))
+
+DEFAULT_COLORBY = 'user_playlist'
+DEFAULT_TERNARY_DIMS = ['audio_feature.acousticness', 'audio_feature.energy', 'audio_feature.valence']
+DEFAULT_POLAR_DIMS = [
+    'audio_feature.acousticness',
+    'audio_feature.danceability',
+    'audio_feature.energy',
+    'audio_feature.instrumentalness',
+    'audio_feature.liveness',
+    'audio_feature.speechiness',
+    'audio_feature.valence',
+]
+
+
+def _cardinality(series):
+    try:
+        return int(series.nunique())
+    except TypeError:
+        # unhashable values, e.g. lists kept in `full` mode
+        return int(series.astype(str).nunique())
+
+
+def profile(df):
+    """
+    Column names, dtypes, numeric min/max, cardinality and null rate of
+    `df`, computed once per dataset version so the dropdowns, table columns
+    and defaults don't each have to look at the rows.
+    """
+    columns = {}
+    for name in sorted(df.columns):
+        series = df[name]
+        numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        info = {
+            'dtype': str(series.dtype),
+            'numeric': bool(numeric),
+            'cardinality': _cardinality(series),
+            'null_rate': float(series.isna().mean()) if len(series) else 0.0,
+            'min': None,
+            'max': None,
+        }
+        if numeric and series.notna().any():
+            info['min'] = float(series.min())
+            info['max'] = float(series.max())
+        columns[name] = info
+    return {'rows': len(df), 'columns': columns}
+
+
+def names(prof):
+    return list(prof['columns'])
+
+
+def hidden(prof):
+    return normalize.hidden_columns(names(prof))
+
+
+def numeric(prof):
+    return [name for name, info in prof['columns'].items() if info['numeric']]
+
+
+def colorby(prof, max_values=COLORBY_MAX_VALUES):
+    """Columns worth coloring by: numeric ones (as a color scale) or text with few distinct values."""
+    return [
+        name for name, info in prof['columns'].items()
+        if info['null_rate'] < 1 and (info['numeric'] or info['cardinality'] <= max_values)
+    ]
+
+
+def value_range(prof, dims):
+    """`(min, max)` over the numeric `dims`, or `(None, None)` if none are known."""
+    cols = [prof['columns'][d] for d in dims if d in prof['columns'] and prof['columns'][d]['min'] is not None]
+    if not cols:
+        return None, None
+    return min(c['min'] for c in cols), max(c['max'] for c in cols)
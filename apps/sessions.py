@@ -0,0 +1,186 @@
+import logging
+import os
+import secrets
+import threading
+import time
+
+import spotipy
+
+import backends
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+SCOPE = 'user-library-read playlist-read-private'
+
+# how long an idle session is kept before its tokens are evicted
+SESSION_TTL = int(os.environ.get('SPOTIVIZ_SESSION_TTL', 60 * 60))
+# refresh access tokens this many seconds before they actually expire
+REFRESH_MARGIN = int(os.environ.get('SPOTIVIZ_REFRESH_MARGIN', 5 * 60))
+
+# point these at a local stub server to run without the real Spotify services,
+# e.g. SPOTIFY_ACCOUNTS_URL=http://localhost:8888 SPOTIFY_API_URL=http://localhost:8888/v1/
+ACCOUNTS_URL = os.environ.get('SPOTIFY_ACCOUNTS_URL')
+API_URL = os.environ.get('SPOTIFY_API_URL')
+
+
+def make_auth_manager(cache_handler=None):
+    auth_manager = spotipy.oauth2.SpotifyOAuth(
+        scope=SCOPE,
+        cache_handler=cache_handler or spotipy.cache_handler.MemoryCacheHandler(),
+        open_browser=False,
+    )
+    if ACCOUNTS_URL:
+        auth_manager.OAUTH_AUTHORIZE_URL = f"{ACCOUNTS_URL.rstrip('/')}/authorize"
+        auth_manager.OAUTH_TOKEN_URL = f"{ACCOUNTS_URL.rstrip('/')}/api/token"
+    return auth_manager
+
+
+def make_client(auth_manager):
+    client = spotipy.Spotify(auth_manager=auth_manager)
+    if API_URL:
+        client.prefix = API_URL if API_URL.endswith('/') else API_URL + '/'
+    return metrics.instrument_client(client)
+
+
+def get_authorize_url():
+    return make_auth_manager().get_authorize_url()
+
+
+class BackendCacheHandler(spotipy.cache_handler.CacheHandler):
+    """Keeps a session's token info in a (possibly shared) cache backend."""
+
+    def __init__(self, backend, key, ttl=SESSION_TTL):
+        self.backend = backend
+        self.key = key
+        self.ttl = ttl
+
+    def get_cached_token(self):
+        return self.backend.get(self.key)
+
+    def save_token_to_cache(self, token_info):
+        self.backend.set(self.key, token_info, ttl=self.ttl)
+
+
+class Session:
+
+    def __init__(self, auth_manager):
+        self.auth_manager = auth_manager
+        self.client = make_client(auth_manager)
+        self.last_used = time.time()
+
+    @property
+    def token_info(self):
+        return self.auth_manager.cache_handler.get_cached_token()
+
+    def refresh_if_needed(self, margin=REFRESH_MARGIN):
+        token_info = self.token_info
+        if not token_info:
+            return False
+        if token_info['expires_at'] - time.time() > margin:
+            return True
+        logger.info(f"refreshing access token ({int(token_info['expires_at'] - time.time())}s left)")
+        self.auth_manager.refresh_access_token(token_info['refresh_token'])
+        return True
+
+    def touch(self, min_interval=60):
+        # re-save the token now and then so the backend TTL slides with activity
+        if time.time() - self.last_used < min_interval:
+            return
+        self.last_used = time.time()
+        token_info = self.token_info
+        if token_info:
+            self.auth_manager.cache_handler.save_token_to_cache(token_info)
+
+
+class SessionRegistry:
+    """
+    Exchanges each auth code once and hands out one pooled client per
+    session. Token info lives in `backend`, so with a shared backend any
+    worker process can serve any session.
+    """
+
+    def __init__(self, backend, ttl=SESSION_TTL, refresh_margin=REFRESH_MARGIN):
+        self.backend = backend
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _session(self, key):
+        auth_manager = make_auth_manager(
+            BackendCacheHandler(self.backend, f"token:{key}", ttl=self.ttl)
+        )
+        return Session(auth_manager)
+
+    def sign_in(self, code):
+        """Exchange `code` for tokens and return the new session key."""
+        key = self.backend.get(f"code:{code}")
+        if key and self.backend.get(f"token:{key}"):
+            return key
+
+        key = secrets.token_urlsafe(16)
+        session = self._session(key)
+        try:
+            session.auth_manager.get_access_token(code, check_cache=False)
+        except spotipy.oauth2.SpotifyOauthError as e:
+            logger.error(f"unable to exchange auth code: {e}")
+            return None
+
+        self.backend.set(f"code:{code}", key, ttl=self.ttl)
+        with self._lock:
+            self._sessions[key] = session
+        self.evict_expired()
+        return key
+
+    def get_client(self, key):
+        if not key:
+            return None
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is None:
+            # signed in through another worker
+            if not self.backend.get(f"token:{key}"):
+                return None
+            session = self._session(key)
+            with self._lock:
+                self._sessions[key] = session
+
+        try:
+            if not session.refresh_if_needed(self.refresh_margin):
+                self.sign_out(key)
+                return None
+        except spotipy.oauth2.SpotifyOauthError as e:
+            logger.error(f"unable to refresh session token: {e}")
+            self.sign_out(key)
+            return None
+
+        session.touch()
+        return session.client
+
+    def sign_out(self, key):
+        self.backend.delete(f"token:{key}")
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def evict_expired(self):
+        """Drop this process's pooled clients for sessions idle longer than the TTL."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [k for k, s in self._sessions.items() if s.last_used < cutoff]
+            for key in expired:
+                logger.info(f"evicting idle session {key[:6]}...")
+                del self._sessions[key]
+        return len(expired)
+
+
+REGISTRY = SessionRegistry(backends.get_backend('sessions', max_items=10000))
+
+
+def sign_in(code):
+    return REGISTRY.sign_in(code)
+
+
+def get_client(key):
+    return REGISTRY.get_client(key)
@@ -0,0 +1,133 @@
+import logging
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# one `&&`-separated clause of a DataTable filter query, e.g. `{popularity} >= 50`
+CLAUSE = re.compile(
+    r"^\{(?P<column>[^}]+)\}\s*"
+    r"(?:(?P<check>is blank|is nil|is num|is str)"
+    r"|(?P<case>[si])?(?P<op>eq|ne|lt|le|gt|ge|contains|datestartswith|!=|<=|>=|=|<|>))"
+    r"\s*(?P<value>.*)$"
+)
+
+OPERATORS = {
+    '=': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge',
+}
+
+
+def _parse_value(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+        return value[1:-1]
+    return value
+
+
+def parse_filter(filter_query):
+    """Split a DataTable filter query into `(column, operator, value, case_sensitive)` clauses."""
+    clauses = []
+    for part in (filter_query or "").split(" && "):
+        part = part.strip()
+        if not part:
+            continue
+        match = CLAUSE.match(part)
+        if match is None:
+            logger.warning(f"ignoring unsupported filter clause: {part}")
+            continue
+        if match['check']:
+            clauses.append((match['column'], match['check'], None, True))
+            continue
+        op = OPERATORS.get(match['op'], match['op'])
+        clauses.append((match['column'], op, _parse_value(match['value']), match['case'] != 'i'))
+    return clauses
+
+
+def _mask(series, op, value, case_sensitive):
+    if op in ('is blank', 'is nil'):
+        return series.isna() | (series.astype(str) == "")
+    if op == 'is num':
+        return pd.to_numeric(series, errors='coerce').notna()
+    if op == 'is str':
+        return series.map(lambda x: isinstance(x, str))
+
+    # as text, missing values would read "nan" or "None" and could match
+    present = series.notna()
+    if op in ('contains', 'datestartswith'):
+        text = series.astype(str)
+        value = str(value)
+        if not case_sensitive:
+            text = text.str.lower()
+            value = value.lower()
+        if op == 'contains':
+            return present & text.str.contains(value, regex=False)
+        return present & text.str.startswith(value)
+
+    if pd.api.types.is_bool_dtype(series):
+        value = str(value).lower() in ('true', '1')
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        value = pd.to_datetime(value, errors='coerce', utc=series.dt.tz is not None)
+    elif pd.api.types.is_numeric_dtype(series):
+        value = pd.to_numeric(value, errors='coerce')
+    else:
+        text = series.astype(str)
+        value = str(value)
+        if not case_sensitive:
+            text = text.str.lower()
+            value = value.lower()
+        return present & getattr(text, op)(value)
+    return getattr(series, op)(value)
+
+
+def apply_filter(df, filter_query):
+    clauses = parse_filter(filter_query)
+    if not clauses:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, op, value, case_sensitive in clauses:
+        if column not in df.columns:
+            continue
+        mask &= _mask(df[column], op, value, case_sensitive).fillna(False).astype(bool)
+    return df[mask]
+
+
+def apply_sort(df, sort_by):
+    sort_by = [s for s in sort_by or [] if s['column_id'] in df.columns]
+    if not sort_by:
+        return df
+    return df.sort_values(
+        [s['column_id'] for s in sort_by],
+        ascending=[s['direction'] == 'asc' for s in sort_by],
+        na_position='last',
+        kind='mergesort',
+    )
+
+
+def query_page(df, page_current, page_size, sort_by=None, filter_query=None, columns=None, position_key=None):
+    """
+    Filter, sort and slice `df` down to one page of `columns`; returns
+    `(rows, page_count)`. With `position_key`, each row also carries its
+    position in `df` under that key.
+    """
+    positions = df.index
+    df = apply_sort(apply_filter(df, filter_query), sort_by)
+    page_count = max(1, math.ceil(len(df) / page_size))
+    page_current = min(page_current or 0, page_count - 1)
+
+    start = page_current * page_size
+    page = df.iloc[start:start + page_size]
+    if columns is not None:
+        page = page[[c for c in page.columns if c in columns]]
+    # float32 columns (see `normalize.compact`) would show as e.g. 0.6129999756813049;
+    # their shortest text form gives back the value as entered
+    narrow = [c for c in page.columns if page[c].dtype == np.float32]
+    page = page.assign(**{c: [float(str(v)) for v in page[c].to_numpy()] for c in narrow})
+    rows = page.to_dict("records")
+    if position_key is not None:
+        for row, position in zip(rows, positions.get_indexer(page.index)):
+            row[position_key] = int(position)
+    return rows, page_count
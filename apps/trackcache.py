@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# set to an empty string to disable the on-disk cache
+CACHE_PATH = os.environ.get('SPOTIVIZ_CACHE_PATH', '.spotiviz-cache.sqlite')
+# seconds a cached artist (genres, popularity, followers) is reused before it's refetched
+ARTIST_TTL = int(os.environ.get('SPOTIVIZ_ARTIST_TTL', 7 * 24 * 60 * 60))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists{suffix} (
+    id TEXT PRIMARY KEY,
+    snapshot_id TEXT NOT NULL,
+    items TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracks{suffix} (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS audio_features (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artists (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+# sqlite caps the number of bound parameters per statement
+CHUNK_SIZE = 500
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class TrackCache:
+    """
+    On-disk cache of playlist contents (keyed by `snapshot_id`), track
+    metadata and audio features (keyed by track ID), and artists (by
+    artist ID, expiring after `ARTIST_TTL` since artists change over time).
+
+    Playlists and tracks are kept separately per `normalize` fields mode,
+    since slim responses can't stand in for full ones. Slim mode uses the
+    original tables: anything cached there before is a superset of it.
+    """
+
+    def __init__(self, path=CACHE_PATH, mode='slim'):
+        self.path = path
+        self.mode = mode
+        suffix = '' if mode == 'slim' else f"_{mode}"
+        self._playlists = f"playlists{suffix}"
+        self._tracks = f"tracks{suffix}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA.format(suffix=suffix))
+
+    def _select(self, table, ids):
+        rows = {}
+        with self._lock:
+            for chunk in _chunks(ids):
+                placeholders = ",".join("?" * len(chunk))
+                cursor = self._conn.execute(
+                    f"SELECT id, data FROM {table} WHERE id IN ({placeholders})", chunk
+                )
+                rows.update((k, json.loads(v)) for k, v in cursor)
+        return rows
+
+    def _upsert(self, table, records):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in records.items()],
+            )
+
+    def get_snapshot_id(self, playlist_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT snapshot_id FROM {self._playlists} WHERE id = ?", (playlist_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_playlist(self, playlist_id):
+        """Return the cached `(playlist_track, audio_feature)` pairs for a playlist."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT items FROM {self._playlists} WHERE id = ?", (playlist_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        items = json.loads(row[0])
+        track_ids = {i['track']['id'] for i in items if i['track'].get('id')}
+        tracks = self._select(self._tracks, track_ids)
+        feats = self._select('audio_features', track_ids)
+
+        results = []
+        for item in items:
+            track_id = item['track'].get('id')
+            if track_id in tracks:
+                item['track'] = tracks[track_id]
+            results.append((item, feats.get(track_id)))
+        return results
+
+    def put_playlist(self, playlist_id, snapshot_id, pairs):
+        tracks = {}
+        feats = {}
+        items = []
+        for playlist_track, feat in pairs:
+            item = dict(playlist_track)
+            track_id = item['track'].get('id')
+            if track_id:
+                tracks[track_id] = item['track']
+                # leave tracks without features uncached so they're retried next time
+                if feat is not None:
+                    feats[track_id] = feat
+                item['track'] = {'id': track_id}
+            items.append(item)
+
+        self._upsert(self._tracks, tracks)
+        self._upsert('audio_features', feats)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._playlists} (id, snapshot_id, items, synced_at) VALUES (?, ?, ?, ?)",
+                (playlist_id, snapshot_id, json.dumps(items), time.time()),
+            )
+
+    def get_audio_features(self, track_ids):
+        """Return `{track_id: audio_feature}` for the IDs already cached."""
+        return self._select('audio_features', track_ids)
+
+    def get_artists(self, artist_ids, max_age=ARTIST_TTL):
+        """Return `{artist_id: artist}` for the IDs cached within the last `max_age` seconds."""
+        rows = {}
+        with self._lock:
+            for chunk in _chunks(artist_ids):
+                placeholders = ",".join("?" * len(chunk))
+                cursor = self._conn.execute(
+                    f"SELECT id, data FROM artists WHERE id IN ({placeholders}) AND fetched_at >= ?",
+                    chunk + [time.time() - max_age],
+                )
+                rows.update((k, json.loads(v)) for k, v in cursor)
+        return rows
+
+    def put_artists(self, artists):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO artists (id, data, fetched_at) VALUES (?, ?, ?)",
+                [(k, json.dumps(v), now) for k, v in artists.items()],
+            )
+
+
+_caches = {}
+_cache_lock = threading.Lock()
+
+
+def get_cache(mode='slim'):
+    if not CACHE_PATH:
+        return None
+    with _cache_lock:
+        if mode not in _caches:
+            logger.info(f"opening {mode} track cache at {CACHE_PATH}")
+            _caches[mode] = TrackCache(CACHE_PATH, mode=mode)
+    return _caches[mode]
@@ -0,0 +1,270 @@
+"""
+End-to-end benchmark: runs the registered Dash callbacks against the mock
+Spotify server (bench/mockspotify.py) the way the browser would, and
+reports load time, per-callback latency, response payload and peak memory.
+
+    python bench/bench_callbacks.py --sizes 1000 10000 100000 --latency 0.02
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS_DIR = os.path.join(BENCH_DIR, '..', 'apps')
+sys.path.insert(0, APPS_DIR)
+
+
+class RecordingApp:
+    """Stands in for `dash.Dash`: keeps each registered callback by its first output."""
+
+    def __init__(self):
+        import flask
+        import logging
+        self.server = flask.Flask(__name__)
+        self.logger = logging.getLogger('bench')
+        self.callbacks = {}
+
+    def callback(self, *args, **kwargs):
+        outputs = args[0]
+        first = outputs[0] if isinstance(outputs, (list, tuple)) else outputs
+
+        def register(fn):
+            self.callbacks[f"{first.component_id}.{first.component_property}"] = fn
+            return fn
+        return register
+
+    def clientside_callback(self, *args, **kwargs):
+        pass
+
+
+def trigger(*prop_ids):
+    # what dash sets for `dash.callback_context` while handling a request
+    import dash._callback_context as context
+    from dash._utils import AttributeDict
+    context.context_value.set(AttributeDict(
+        triggered_inputs=[{'prop_id': p, 'value': None} for p in prop_ids],
+        input_values={}, state_values={}, outputs_list=[], inputs_list=[], states_list=[],
+    ))
+
+
+def payload_bytes(result):
+    import dash
+    import plotly.utils
+    outputs = result if isinstance(result, (list, tuple)) else [result]
+    outputs = [o for o in outputs if o is not dash.no_update]
+    return len(json.dumps(outputs, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+class Runner:
+
+    def __init__(self, app):
+        self.app = app
+        self.timings = {}
+
+    def run(self, name, output, *args, triggered=()):
+        trigger(*triggered)
+        start = time.perf_counter()
+        result = self.app.callbacks[output](*args)
+        elapsed = time.perf_counter() - start
+        self.timings.setdefault(name, []).append((elapsed, payload_bytes(result)))
+        return result
+
+    def render_all(self, ref, states, suffix=''):
+        """What the browser triggers whenever `track-data` changes."""
+        import dash
+        self.run('apply_profile' + suffix, 'table.columns', ref, *[None] * 10)
+        self.run('show_table' + suffix, 'table.data', ref, 0, 20, [], "", [])
+        scatter = self.run(
+            'render_scatterplot' + suffix, 'scatter.figure',
+            'audio_feature.energy', 'audio_feature.valence', None, 'user_playlist', ref, None,
+            False, states.get('scatter'),
+        )
+        polar = self.run(
+            'render_polarplot' + suffix, 'polar.figure',
+            ['audio_feature.acousticness', 'audio_feature.danceability', 'audio_feature.energy',
+             'audio_feature.liveness', 'audio_feature.valence'],
+            'user_playlist', 'tracks', ref, None, 0, 1, True, states.get('polar'),
+        )
+        self.run('render_ternary' + suffix, 'ternary.figure',
+                 'audio_feature.acousticness', 'audio_feature.energy', 'audio_feature.valence', 'user_playlist', ref)
+        self.run('render_overlap' + suffix, 'overlap.figure', 'tracks', ref)
+        map_ = self.run('render_map' + suffix, 'map.figure', 2, 'user_playlist', ref, states.get('map'))
+        for key, result in (('scatter', scatter), ('polar', polar), ('map', map_)):
+            if result[-1] is not dash.no_update:
+                states[key] = result[-1]
+
+
+def wait_for(url, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"mock server at {url} didn't start")
+
+
+def load(runner, token, poll_interval):
+    """Select every playlist and poll the background load like the browser does."""
+    playlists = runner.run(
+        'show_playlists', 'playlists.data', token, None, None, None, None, None, None,
+        triggered=['sign-in-token.data'],
+    )
+    options, _, limit, _, catalog_job = playlists
+    while True:
+        playlists = runner.run(
+            'show_playlists (poll)', 'playlists.data', token, None, None, 1, None, limit, catalog_job,
+            triggered=['catalog-poll.n_intervals'],
+        )
+        if playlists[3] is True:
+            break
+        time.sleep(poll_interval)
+    playlist_ids = [o['value'] for o in playlists[0]]
+
+    start = time.perf_counter()
+    out = runner.run(
+        'load_playlist_tracks', 'track-data.data', playlist_ids, None, None, token, None, None, None, None,
+        triggered=['playlists.value'],
+    )
+    job_id, ref, first_partial, states = out[1], None, None, {}
+    while True:
+        time.sleep(poll_interval)
+        out = runner.run(
+            'load_playlist_tracks (poll)', 'track-data.data', playlist_ids, 1, None, token, ref, job_id, None, None,
+            triggered=['load-poll.n_intervals'],
+        )
+        if isinstance(out[0], dict):
+            ref = out[0]
+            first_partial = first_partial or time.perf_counter() - start
+            runner.render_all(ref, states, suffix=' (while loading)')
+        if out[2] is True:
+            break
+    return ref, time.perf_counter() - start, first_partial
+
+
+def enrich(runner, token, ref, poll_interval):
+    """Pick an artist column and poll the artist lookup it starts."""
+    start = time.perf_counter()
+    wanted, artist_job, _ = runner.run(
+        'request_artist_columns', 'artist-columns.data',
+        None, None, None, 'artist.genre', None, None, None, None, None, None, None, None,
+        token, ref, None, None,
+    )
+    out = runner.run(
+        'load_playlist_tracks (artists)', 'track-data.data', None, None, 1, token, ref, None, wanted, artist_job,
+        triggered=['artist-poll.n_intervals'],
+    )
+    job_id = out[1]
+    while True:
+        time.sleep(poll_interval)
+        out = runner.run(
+            'load_playlist_tracks (poll)', 'track-data.data', None, 1, None, token, ref, job_id, wanted, None,
+            triggered=['load-poll.n_intervals'],
+        )
+        if out[2] is True:
+            break
+    return out[0], time.perf_counter() - start
+
+
+def bench_size(args, size, port):
+    import datasets
+    import sessions
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'mockspotify.py'), '--tracks', str(size),
+         '--playlists', str(args.playlists), '--latency', str(args.latency),
+         '--rate-limit', str(args.rate_limit), '--port', str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_for(base + '/_stats')
+        app = RecordingApp()
+        import callbacks
+        callbacks.register_callbacks(app)
+        runner = Runner(app)
+
+        token = runner.run('store_token', 'sign-in-token.data', f"http://localhost:8050/?code=bench-{size}")
+        ref, load_time, first_partial = load(runner, token, args.poll_interval)
+        df = datasets.get(ref)
+        enriched, enrich_time = enrich(runner, token, ref, args.poll_interval)
+        runner.run('render_scatterplot (artist genre)', 'scatter.figure',
+                   'audio_feature.energy', 'audio_feature.valence', None, 'artist.genre', enriched, None,
+                   False, None)
+        api = json.loads(urllib.request.urlopen(base + '/_stats').read())
+
+        # interactions on the fully loaded dataset, each on a cold figure cache
+        runner.render_all(ref, {})
+        page = runner.run('show_table (sort+filter)', 'table.data', ref, 3, 20,
+                   [{'column_id': 'popularity', 'direction': 'desc'}],
+                   "{explicit} eq true && {audio_feature.energy} > 0.5", [])
+        highlight = runner.run('find_similar_tracks', 'similar-tracks.data', [0], ref, 3, None, None, page[0], None,
+                               triggered=['table.selected_rows'])[0]
+        runner.run('render_scatterplot (similar)', 'scatter.figure',
+                   'audio_feature.energy', 'audio_feature.valence', None, 'user_playlist', ref, highlight,
+                   False, None)
+        runner.run('render_polarplot (mean)', 'polar.figure',
+                   ['audio_feature.energy', 'audio_feature.valence', 'audio_feature.danceability'],
+                   'user_playlist', 'mean', ref, None, 0, 1, True, None)
+
+        peak = None
+        if not args.no_memory:
+            # a second, traced load; tracing slows it down, so it's not timed
+            tracemalloc.start()
+            load(Runner(app), sessions.sign_in(f"bench-memory-{size}"), args.poll_interval)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"\n{size:,} tracks ({len(df):,} rows): loaded in {load_time:.2f}s, "
+          f"first partial after {first_partial:.2f}s, artists joined after {enrich_time:.2f}s"
+          + (f", peak traced memory {peak / 2 ** 20:.0f}MB" if peak is not None else ""))
+    print(f"  API: {sum(api['requests'].values())} requests ({api['rate_limited']} rate limited), "
+          f"{api['bytes_sent'] / 2 ** 20:.1f}MB: "
+          + ", ".join(f"{k} {v}" for k, v in sorted(api['requests'].items())))
+    print(f"  {'callback':<36} {'calls':>5} {'mean ms':>9} {'max ms':>9} {'mean KB':>9}")
+    for name, samples in runner.timings.items():
+        times = [t for t, _ in samples]
+        sizes = [b for _, b in samples]
+        print(f"  {name:<36} {len(samples):>5} {sum(times) / len(times) * 1000:9.1f} "
+              f"{max(times) * 1000:9.1f} {sum(sizes) / len(sizes) / 1024:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--playlists', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--rate-limit', type=float, default=0.0)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced peak memory run")
+    args = parser.parse_args()
+
+    # configure the app for the mock server before any app module is imported
+    base = f"http://127.0.0.1:{args.port}"
+    os.environ.update({
+        'SPOTIFY_ACCOUNTS_URL': base,
+        'SPOTIFY_API_URL': base + '/v1/',
+        'SPOTIPY_CLIENT_ID': 'bench',
+        'SPOTIPY_CLIENT_SECRET': 'bench',
+        'SPOTIPY_REDIRECT_URI': 'http://localhost:8050/',
+        'SPOTIVIZ_CACHE_PATH': os.environ.get('SPOTIVIZ_CACHE_PATH', ''),
+        'SPOTIVIZ_FIGURE_CACHE_SIZE': '0',
+        'SPOTIVIZ_CACHE_DIR': tempfile.mkdtemp(prefix='spotiviz-bench-'),
+    })
+    for size in args.sizes:
+        bench_size(args, size, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Compare the old serial playlist walk against the concurrent fetch engine
+using an in-process mock Spotify client with injected round-trip latency.
+
+    python bench/bench_fetch.py --playlists 10 --tracks 2000 --latency 0.05
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'apps'))
+
+import fetch  # noqa: E402
+import trackcache  # noqa: E402
+
+
+class MockSpotify:
+
+    def __init__(self, playlists, tracks, latency, overlap=0.0, jitter=0.5, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.feature_calls = 0
+        # `overlap` of each playlist's tracks come from a pool shared by all playlists
+        shared = int(tracks * overlap)
+        pool = [f"spotify:track:shared-{t}" for t in range(tracks)]
+        self.playlists = {
+            f"playlist{p}": (
+                self.rng.sample(pool, shared)
+                + [f"spotify:track:{p}-{t}" for t in range(tracks - shared)]
+            )
+            for p in range(playlists)
+        }
+
+    def _wait(self, features=False):
+        with self.lock:
+            self.calls += 1
+            self.feature_calls += features
+            delay = self.latency * (1 + self.jitter * self.rng.random())
+        time.sleep(delay)
+
+    def playlist(self, playlist_id, fields=None):
+        self._wait()
+        return {
+            'snapshot_id': f"{playlist_id}-snapshot",
+            'tracks': {'total': len(self.playlists[playlist_id])},
+        }
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0):
+        self._wait()
+        uris = self.playlists[playlist_id]
+        if fields == 'total':
+            return {'total': len(uris)}
+        return {
+            'total': len(uris),
+            'items': [
+                {'added_at': '2022-01-01T00:00:00Z', 'track': {'uri': uri, 'id': uri.split(':')[-1]}}
+                for uri in uris[offset:offset + limit]
+            ],
+        }
+
+    def audio_features(self, tracks):
+        self._wait(features=True)
+        return [{'uri': uri, 'energy': 0.5} for uri in tracks]
+
+
+def fetch_serial(client, playlist_ids):
+    results = {}
+    for playlist_id in playlist_ids:
+        results[playlist_id] = []
+        total = client.playlist_items(playlist_id, fields='total')['total']
+        offset = 0
+        while offset < total:
+            playlist_tracks = client.playlist_items(playlist_id, offset=offset)['items']
+            offset += len(playlist_tracks)
+            feats = client.audio_features(tracks=[t['track']['uri'] for t in playlist_tracks])
+            results[playlist_id] += list(zip(playlist_tracks, feats))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--playlists', type=int, default=10)
+    parser.add_argument('--tracks', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--overlap', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=fetch.MAX_WORKERS)
+    args = parser.parse_args()
+
+    cache = trackcache.TrackCache(':memory:')
+    for label, fn in [
+        ('serial', fetch_serial),
+        (f'concurrent ({args.workers} workers)', lambda c, p: fetch.fetch_playlists(c, p, max_workers=args.workers)),
+        ('concurrent, cold cache', lambda c, p: fetch.fetch_playlists(c, p, cache=cache, max_workers=args.workers)),
+        ('concurrent, warm cache', lambda c, p: fetch.fetch_playlists(c, p, cache=cache, max_workers=args.workers)),
+    ]:
+        client = MockSpotify(args.playlists, args.tracks, args.latency, overlap=args.overlap)
+        playlist_ids = list(client.playlists)
+        start = time.perf_counter()
+        results = fn(client, playlist_ids)
+        elapsed = time.perf_counter() - start
+        n_tracks = sum(len(v) for v in results.values())
+        print(f"{label:<28} {elapsed:8.2f}s  {client.calls:5d} calls "
+              f"({client.feature_calls} audio_features)  {n_tracks} tracks")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare full playlist item pages against the slim `fields` projection:
+response bytes, JSON parse time, normalize time and dataset memory.
+
+    python bench/bench_fields.py --tracks 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'apps'))
+
+import fetch  # noqa: E402
+import normalize  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def pages(library, fields):
+    """Serialize the library as `playlist_items` pages, projected to `fields`."""
+    out = {}
+    for playlist_id, pairs in library.items():
+        items = [item for item, _ in pairs]
+        out[playlist_id] = [
+            json.dumps(synthetic.project({'items': items[i:i + fetch.PAGE_SIZE], 'total': len(items)}, fields))
+            for i in range(0, len(items), fetch.PAGE_SIZE)
+        ]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=10000)
+    args = parser.parse_args()
+
+    library = synthetic.make_library(args.tracks)
+    names = {p: p for p in library}
+    feats = {p: [f for _, f in pairs] for p, pairs in library.items()}
+
+    print(f"{'mode':>5} {'payload':>10} {'parse':>8} {'normalize':>10} {'dataset':>9} {'columns':>8}")
+    for mode in normalize.MODES:
+        raw = pages(library, normalize.api_fields(mode))
+        payload = sum(len(p) for ps in raw.values() for p in ps)
+
+        start = time.perf_counter()
+        parsed = {p: [json.loads(page) for page in ps] for p, ps in raw.items()}
+        parse = time.perf_counter() - start
+
+        tracks = {
+            p: list(zip([item for page in ps for item in page['items']], feats[p]))
+            for p, ps in parsed.items()
+        }
+        start = time.perf_counter()
+        df = normalize.normalize(tracks, names, mode=mode)
+        elapsed = time.perf_counter() - start
+        nbytes = df.memory_usage(deep=True).sum()
+        print(f"{mode:>5} {payload / 2 ** 20:8.1f}MB {parse:7.2f}s {elapsed:9.2f}s "
+              f"{nbytes / 2 ** 20:7.1f}MB {len(df.columns):>8}")
+
+
+if __name__ == '__main__':
+    main()
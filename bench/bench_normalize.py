@@ -0,0 +1,74 @@
+"""
+Compare the original json_normalize/apply pipeline against normalize.normalize.
+
+    python bench/bench_normalize.py --sizes 1000 10000 50000
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'apps'))
+
+import normalize  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def normalize_legacy(playlist_tracks, playlist_names):
+    data = []
+    for playlist_id, pairs in playlist_tracks.items():
+        for playlist_track, feat in pairs:
+            track = playlist_track['track']
+            track['user_playlist'] = playlist_names[playlist_id]
+            track.update({"audio_feature." + k: v for k, v in feat.items()})
+            for k, v in playlist_track.items():
+                if isinstance(v, (dict, list)):
+                    continue
+                track[k] = v
+            if track not in data:
+                data.append(track)
+
+    df = pd.json_normalize(data)
+    df['artists'] = df['artists'].apply(lambda x: ", ".join(sorted([a['name'] for a in x])))
+    for col in df.columns:
+        if not df[col].apply(lambda x: isinstance(x, list)).any():
+            continue
+        try:
+            df[col] = df[col].apply(lambda x: "/".join(x))
+        except Exception:
+            df.drop(col, axis=1, inplace=True)
+    for col in ['added_at', 'album.release_date']:
+        df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help="skip the quadratic legacy pipeline above this many tracks")
+    args = parser.parse_args()
+
+    print(f"{'tracks':>8} {'legacy':>10} {'normalize':>10}")
+    for size in args.sizes:
+        library = synthetic.make_library(size)
+        names = {p: p for p in library}
+
+        legacy = '-'
+        if size <= args.legacy_max:
+            data = copy.deepcopy(library)
+            start = time.perf_counter()
+            normalize_legacy(data, names)
+            legacy = f"{time.perf_counter() - start:9.2f}s"
+
+        start = time.perf_counter()
+        normalize.normalize(library, names)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>8} {legacy:>10} {elapsed:9.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Measure render throughput of the production server at different worker
+counts. A synthetic dataset is published through the shared `file` cache
+backend, then concurrent clients POST scatter renders with varying axes
+(the figure cache is disabled so every request does real work).
+
+    python bench/loadtest.py --workers 1 2 4 --requests 200 --concurrency 16
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+APPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps')
+sys.path.insert(0, APPS_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+AXES = [
+    'audio_feature.acousticness',
+    'audio_feature.danceability',
+    'audio_feature.energy',
+    'audio_feature.liveness',
+    'audio_feature.tempo',
+    'audio_feature.valence',
+]
+
+
+def publish_dataset(n_tracks, env):
+    # import with the same backend settings the server will use
+    os.environ.update(env)
+    import datasets
+    import normalize
+    import synthetic
+
+    library = synthetic.make_library(n_tracks)
+    df = normalize.normalize(library, {p: p for p in library})
+    return datasets.put(df)
+
+
+def render_request(ref, i):
+    xaxis = AXES[i % len(AXES)]
+    yaxis = AXES[(i // len(AXES)) % len(AXES)]
+    values = {'scatter-xaxis': xaxis, 'scatter-yaxis': yaxis, 'scatter-zaxis': None,
+              'scatter-colorby': 'user_playlist'}
+    outputs = [('scatter', 'figure'), ('scatter', 'extendData'), ('scatter-state', 'data')]
+    return {
+        'output': '..' + '...'.join(f"{c}.{p}" for c, p in outputs) + '..',
+        'outputs': [{'id': c, 'property': p} for c, p in outputs],
+        'inputs': [{'id': k, 'property': 'value', 'value': v} for k, v in values.items()]
+        + [{'id': 'track-data', 'property': 'data', 'value': ref},
+           {'id': 'similar-tracks', 'property': 'data', 'value': None}],
+        'changedPropIds': ['scatter-xaxis.value'],
+        'state': [{'id': 'scatter-showlines', 'property': 'value', 'value': bool(i % 2)},
+                  {'id': 'scatter-state', 'property': 'data', 'value': None}],
+    }
+
+
+def post(url, body):
+    req = urllib.request.Request(
+        url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        return len(resp.read())
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"server at {url} didn't start")
+
+
+def run(workers, args, env, ref):
+    port = args.port
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:server', '-c', 'gunicorn.conf.py'],
+        cwd=APPS_DIR,
+        env={
+            **os.environ, **env,
+            'SPOTIVIZ_WORKERS': str(workers),
+            'SPOTIVIZ_BIND': f"127.0.0.1:{port}",
+            'SPOTIVIZ_ACCESS_LOG': '/dev/null',
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_for(base + '/_dash-layout')
+        url = base + '/_dash-update-component'
+        # warm every worker's copy of the dataset
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda i: post(url, render_request(ref, i)), range(workers * 4)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            sizes = list(pool.map(lambda i: post(url, render_request(ref, i)), range(args.requests)))
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>7} {args.requests / elapsed:10.1f} req/s {elapsed / args.requests * 1000:8.0f} ms/req "
+              f"{sum(sizes) / len(sizes) / 1024:8.0f} KB/resp")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--port', type=int, default=8077)
+    args = parser.parse_args()
+
+    env = {
+        'SPOTIVIZ_CACHE_BACKEND': 'file',
+        'SPOTIVIZ_CACHE_DIR': tempfile.mkdtemp(prefix='spotiviz-loadtest-'),
+        'SPOTIVIZ_FIGURE_CACHE_SIZE': '0',
+        'SPOTIVIZ_CACHE_PATH': '',
+    }
+    ref = publish_dataset(args.tracks, env)
+
+    print(f"{'workers':>7} {'throughput':>14} {'latency':>11} {'payload':>12}")
+    for workers in args.workers:
+        run(workers, args, env, ref)
+
+
+if __name__ == '__main__':
+    main()
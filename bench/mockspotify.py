@@ -0,0 +1,268 @@
+"""
+Local stand-in for the parts of the Spotify Web API and accounts service
+the app uses, serving a synthetic library with injectable latency and 429s.
+
+    python bench/mockspotify.py --tracks 10000 --port 8888 --latency 0.05
+
+then point the app at it:
+
+    SPOTIFY_ACCOUNTS_URL=http://localhost:8888 SPOTIFY_API_URL=http://localhost:8888/v1/
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+GENRES = ['pop', 'rock', 'indie', 'hip hop', 'jazz', 'electronic', 'folk', 'metal', 'soul', 'ambient']
+
+
+class MockSpotify:
+    """Synthetic user library plus per-endpoint request accounting."""
+
+    def __init__(self, n_tracks=1000, n_playlists=10, overlap=0.2, latency=0.0,
+                 jitter=0.5, rate_limit=0.0, retry_after=1, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.load(n_tracks, n_playlists, overlap, seed)
+
+    def load(self, n_tracks, n_playlists=10, overlap=0.2, seed=0):
+        """Replace the library, e.g. between benchmark sizes."""
+        library = synthetic.make_library(n_tracks, n_playlists, overlap=overlap, seed=seed)
+        # a different library looks like a different user, so app-side caches don't mix them up
+        self.user_id = f"mock-user-{n_tracks}-{n_playlists}-{seed}"
+        self.playlists = {
+            playlist_id: {
+                'id': playlist_id,
+                'name': f"Synthetic {playlist_id}",
+                'snapshot_id': f"{playlist_id}-{seed}",
+                'items': [item for item, _ in pairs],
+            }
+            for playlist_id, pairs in library.items()
+        }
+        self.features = {f['id']: f for pairs in library.values() for _, f in pairs}
+        self.artists = {}
+        for pairs in library.values():
+            for item, _ in pairs:
+                for artist in item['track']['artists']:
+                    self.artists.setdefault(artist['id'], self._artist(artist))
+        self.reset()
+
+    def _artist(self, artist):
+        rng = random.Random(artist['id'])
+        return dict(
+            artist,
+            genres=rng.sample(GENRES, k=rng.randint(0, 3)),
+            popularity=rng.randint(0, 100),
+            followers={'href': None, 'total': rng.randint(0, 10 ** 6)},
+        )
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.rate_limited = 0
+            self.bytes_sent = 0
+
+    def delay(self):
+        with self.lock:
+            return self.latency * (1 + self.jitter * self.rng.random())
+
+    def should_rate_limit(self):
+        with self.lock:
+            limited = self.rng.random() < self.rate_limit
+            self.rate_limited += limited
+            return limited
+
+    # endpoint handlers return (status, body)
+
+    def token(self, form):
+        return 200, {
+            'access_token': f"mock-access-{time.time()}",
+            'token_type': 'Bearer',
+            'expires_in': 3600,
+            'refresh_token': form.get('refresh_token', 'mock-refresh'),
+            'scope': 'user-library-read playlist-read-private',
+        }
+
+    def me(self, query):
+        return 200, {
+            'id': self.user_id,
+            'display_name': 'Mock User',
+            'images': [{'url': 'https://i.scdn.co/image/mock', 'height': 64, 'width': 64}],
+        }
+
+    def my_playlists(self, query):
+        limit, offset = int(query.get('limit', 20)), int(query.get('offset', 0))
+        playlists = list(self.playlists.values())
+        items = [
+            {
+                'id': p['id'], 'name': p['name'], 'snapshot_id': p['snapshot_id'],
+                'tracks': {'href': None, 'total': len(p['items'])},
+            }
+            for p in playlists[offset:offset + limit]
+        ]
+        return 200, self._page(items, limit, offset, len(playlists))
+
+    def playlist(self, playlist_id, query):
+        p = self.playlists.get(playlist_id)
+        if p is None:
+            return 404, {'error': {'status': 404, 'message': 'Not found.'}}
+        body = {
+            'id': p['id'], 'name': p['name'], 'snapshot_id': p['snapshot_id'],
+            'tracks': {'total': len(p['items'])},
+        }
+        return 200, synthetic.project(body, query.get('fields'))
+
+    def playlist_items(self, playlist_id, query):
+        p = self.playlists.get(playlist_id)
+        if p is None:
+            return 404, {'error': {'status': 404, 'message': 'Not found.'}}
+        limit, offset = int(query.get('limit', 100)), int(query.get('offset', 0))
+        body = self._page(p['items'][offset:offset + limit], limit, offset, len(p['items']))
+        return 200, synthetic.project(body, query.get('fields'))
+
+    def audio_features(self, query):
+        ids = [i for i in query.get('ids', '').split(',') if i]
+        return 200, {'audio_features': [self.features.get(i) for i in ids]}
+
+    def get_artists(self, query):
+        ids = [i for i in query.get('ids', '').split(',') if i]
+        return 200, {'artists': [self.artists.get(i) for i in ids]}
+
+    @staticmethod
+    def _page(items, limit, offset, total):
+        return {
+            'items': items, 'limit': limit, 'offset': offset, 'total': total,
+            'next': 'more' if offset + limit < total else None, 'previous': None,
+        }
+
+
+ROUTES = [
+    (re.compile(r"^/v1/me$"), 'me'),
+    (re.compile(r"^/v1/me/playlists$"), 'my_playlists'),
+    (re.compile(r"^/v1/playlists/([^/]+)$"), 'playlist'),
+    (re.compile(r"^/v1/playlists/([^/]+)/tracks$"), 'playlist_items'),
+    (re.compile(r"^/v1/audio-features$"), 'audio_features'),
+    (re.compile(r"^/v1/artists$"), 'get_artists'),
+]
+
+
+def make_handler(mock):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+            with mock.lock:
+                mock.bytes_sent += len(raw)
+
+        def do_GET(self):
+            url = parse.urlparse(self.path)
+            path = url.path.rstrip('/')
+            query = {k: v[-1] for k, v in parse.parse_qs(url.query).items()}
+
+            if path == '/_stats':
+                with mock.lock:
+                    stats = {'requests': dict(mock.requests), 'rate_limited': mock.rate_limited,
+                             'bytes_sent': mock.bytes_sent}
+                self.send_json(200, stats)
+                return
+
+            if path == '/authorize':
+                # approve immediately, as if the user clicked "Agree"
+                redirect = f"{query['redirect_uri']}?code=mock-code-{time.time()}&state={query.get('state', '')}"
+                self.send_response(302)
+                self.send_header('Location', redirect)
+                self.end_headers()
+                return
+
+            for pattern, name in ROUTES:
+                match = pattern.match(path)
+                if match:
+                    break
+            else:
+                self.send_json(404, {'error': {'status': 404, 'message': 'Service not found'}})
+                return
+
+            with mock.lock:
+                mock.requests[name] += 1
+            time.sleep(mock.delay())
+            if mock.should_rate_limit():
+                self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                               headers={'Retry-After': str(mock.retry_after)})
+                return
+            status, body = getattr(mock, name)(*match.groups(), query)
+            self.send_json(status, body)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = {k: v[-1] for k, v in parse.parse_qs(self.rfile.read(length).decode()).items()}
+            if parse.urlparse(self.path).path.rstrip('/') != '/api/token':
+                self.send_json(404, {'error': 'not_found'})
+                return
+            with mock.lock:
+                mock.requests['token'] += 1
+            self.send_json(*mock.token(form))
+
+    return Handler
+
+
+def serve(mock, host='127.0.0.1', port=0):
+    """Start serving `mock` on a background thread; returns `(server, base_url)`."""
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=1000)
+    parser.add_argument('--playlists', type=int, default=10)
+    parser.add_argument('--overlap', type=float, default=0.2)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to each API request")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="fraction of API requests answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    args = parser.parse_args()
+
+    mock = MockSpotify(
+        args.tracks, args.playlists, overlap=args.overlap, latency=args.latency,
+        rate_limit=args.rate_limit, retry_after=args.retry_after,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    print(f"serving {args.tracks} tracks in {args.playlists} playlists on http://{args.host}:{args.port}")
+    print(f"  SPOTIFY_ACCOUNTS_URL=http://{args.host}:{args.port} SPOTIFY_API_URL=http://{args.host}:{args.port}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
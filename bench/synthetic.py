@@ -0,0 +1,147 @@
+"""Synthetic Spotify-shaped playlist items for benchmarks."""
+import random
+import string
+
+MARKETS = [a + b for a in string.ascii_uppercase[:14] for b in string.ascii_uppercase[:13]]
+
+
+def _id(rng):
+    return "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(22))
+
+
+def make_artist(rng):
+    artist_id = _id(rng)
+    return {
+        'external_urls': {'spotify': f"https://open.spotify.com/artist/{artist_id}"},
+        'href': f"https://api.spotify.com/v1/artists/{artist_id}",
+        'id': artist_id,
+        'name': f"Artist {artist_id[:6]}",
+        'type': 'artist',
+        'uri': f"spotify:artist:{artist_id}",
+    }
+
+
+def make_track(rng, artists, track_id=None):
+    track_id = track_id or _id(rng)
+    album_id = _id(rng)
+    track_artists = rng.sample(artists, k=rng.randint(1, 3))
+    return {
+        'album': {
+            'album_type': rng.choice(['album', 'single', 'compilation']),
+            'artists': track_artists[:1],
+            'available_markets': MARKETS,
+            'external_urls': {'spotify': f"https://open.spotify.com/album/{album_id}"},
+            'href': f"https://api.spotify.com/v1/albums/{album_id}",
+            'id': album_id,
+            'images': [
+                {'height': h, 'url': f"https://i.scdn.co/image/{album_id}{h}", 'width': h}
+                for h in (640, 300, 64)
+            ],
+            'name': f"Album {album_id[:6]}",
+            'release_date': f"{rng.randint(1960, 2021)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'release_date_precision': 'day',
+            'total_tracks': rng.randint(1, 20),
+            'type': 'album',
+            'uri': f"spotify:album:{album_id}",
+        },
+        'artists': track_artists,
+        'available_markets': MARKETS,
+        'disc_number': 1,
+        'duration_ms': rng.randint(90_000, 400_000),
+        'episode': False,
+        'explicit': rng.random() < 0.2,
+        'external_ids': {'isrc': f"US{_id(rng)[:10].upper()}"},
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"},
+        'href': f"https://api.spotify.com/v1/tracks/{track_id}",
+        'id': track_id,
+        'is_local': False,
+        'name': f"Track {track_id[:6]}",
+        'popularity': rng.randint(0, 100),
+        'preview_url': None,
+        'track': True,
+        'track_number': rng.randint(1, 20),
+        'type': 'track',
+        'uri': f"spotify:track:{track_id}",
+    }
+
+
+def make_audio_feature(rng, track):
+    return {
+        'acousticness': rng.random(),
+        'analysis_url': f"https://api.spotify.com/v1/audio-analysis/{track['id']}",
+        'danceability': rng.random(),
+        'duration_ms': track['duration_ms'],
+        'energy': rng.random(),
+        'id': track['id'],
+        'instrumentalness': rng.random(),
+        'key': rng.randint(0, 11),
+        'liveness': rng.random(),
+        'loudness': -60 * rng.random(),
+        'mode': rng.randint(0, 1),
+        'speechiness': rng.random(),
+        'tempo': 60 + 120 * rng.random(),
+        'time_signature': 4,
+        'track_href': track['href'],
+        'type': 'audio_features',
+        'uri': track['uri'],
+        'valence': rng.random(),
+    }
+
+
+def make_playlist_item(rng, track):
+    return {
+        'added_at': f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+        'added_by': {'id': 'user'},
+        'is_local': False,
+        'primary_color': None,
+        'track': track,
+        'video_thumbnail': {'url': None},
+    }
+
+
+def make_library(n_tracks, n_playlists=10, overlap=0.2, seed=0):
+    """Return `{playlist_id: [(playlist_track, audio_feature), ...]}` with ~n_tracks rows in total."""
+    rng = random.Random(seed)
+    artists = [make_artist(rng) for _ in range(max(10, n_tracks // 10))]
+    tracks = [make_track(rng, artists) for _ in range(n_tracks)]
+    feats = {t['id']: make_audio_feature(rng, t) for t in tracks}
+
+    per_playlist = max(1, n_tracks // n_playlists)
+    library = {}
+    for p in range(n_playlists):
+        chosen = tracks[p * per_playlist:(p + 1) * per_playlist]
+        # share some tracks with other playlists
+        n_shared = int(len(chosen) * overlap)
+        chosen = chosen[:len(chosen) - n_shared] + rng.sample(tracks, k=n_shared)
+        library[f"playlist{p}"] = [
+            (make_playlist_item(rng, dict(t)), feats[t['id']]) for t in chosen
+        ]
+    return library
+
+
+def _split_fields(fields):
+    # top-level comma-separated parts, keeping parenthesized groups together
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(fields):
+        depth += (c == '(') - (c == ')')
+        if c == ',' and depth == 0:
+            parts.append(fields[start:i])
+            start = i + 1
+    parts.append(fields[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def project(obj, fields):
+    """Apply a Spotify Web API `fields` filter (e.g. `items(track(name,album(id)))`) to `obj`."""
+    if not fields:
+        return obj
+    if isinstance(obj, list):
+        return [project(o, fields) for o in obj]
+    if not isinstance(obj, dict):
+        return obj
+    projected = {}
+    for part in _split_fields(fields):
+        name, _, sub = part.partition('(')
+        if name in obj:
+            projected[name] = project(obj[name], sub[:-1]) if sub else obj[name]
+    return projected